@@ -1,7 +1,17 @@
 # SPDX-License-Identifier: GPL-2.0+
 
 import logging
-from flask import Blueprint, request, current_app, jsonify, url_for, redirect
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    json,
+    jsonify,
+    redirect,
+    request,
+    stream_with_context,
+    url_for,
+)
 from werkzeug.exceptions import BadRequest
 from greenwave import __version__
 from greenwave.policies import (
@@ -20,6 +30,25 @@ import greenwave.decision
 api = (Blueprint('api_v1', __name__))
 log = logging.getLogger(__name__)
 
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def _accepts_ndjson():
+    best_match = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best_match == NDJSON_MIMETYPE
+
+
+def _ndjson_response(items):
+    """
+    Returns response streaming items as newline-delimited JSON.
+    """
+    def generate():
+        for item in items:
+            yield json.dumps(item) + '\n'
+
+    resp = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    return insert_headers(resp)
+
 
 @api.route('/version', methods=['GET'])
 def version():
@@ -346,6 +375,17 @@ def make_decision():
         in response only if ``verbose`` is true.
     :resjson string summary: A user-friendly summary.
 
+    If the request prefers :mimetype:`application/x-ndjson` in the ``Accept``
+    header, the response is streamed as newline-delimited JSON. The first
+    line contains ``policies_satisfied``, ``summary`` and
+    ``applicable_policies``. Each following line contains a single item under
+    ``satisfied_requirement``, ``unsatisfied_requirement``, ``result`` or
+    ``waiver`` key.
+
+    Streaming avoids building the whole JSON response in memory. The decision
+    itself is still made before the first line is sent, so the test results
+    and waivers retrieved for it are all held in memory at once.
+
     :statuscode 200: A decision was made.
     :statuscode 400: Invalid data was given.
     :statuscode 404: No Koji build found
@@ -353,6 +393,10 @@ def make_decision():
     :statuscode 504: Timeout while querying an upstream
     """  # noqa: E501
     data = request.get_json()
+    if _accepts_ndjson():
+        lines = greenwave.decision.make_decision_lines(data, current_app.config)
+        return _ndjson_response(lines)
+
     response = greenwave.decision.make_decision(data, current_app.config)
     log.debug('Response: %s', response)
     resp = jsonify(response)
@@ -361,6 +405,126 @@ def make_decision():
     return resp
 
 
+@api.route('/decisions', methods=['OPTIONS'])
+@jsonp
+def make_decisions_options():
+    """ Handles the OPTIONS requests to the /decisions endpoint. """
+    resp = current_app.make_default_options_response()
+    return insert_headers(resp)
+
+
+@api.route('/decisions', methods=['POST'])
+@decision_exception_counter.count_exceptions()
+@decision_request_duration_seconds.time()
+@jsonp
+def make_decisions():
+    """
+    Make decisions for multiple decision requests at once. The request must be
+    :mimetype:`application/json`.
+
+    Each item in ``decisions`` is a decision request as accepted by
+    :http:post:`/api/v1.0/decision`. Test results, waivers, Koji builds and
+    remote rule files needed by multiple items are retrieved only once.
+
+    **Sample request**:
+
+    .. sourcecode:: http
+
+       POST /api/v1.0/decisions HTTP/1.1
+       Accept: application/json
+       Content-Type: application/json
+
+       {
+           "decisions": [
+               {
+                   "decision_context": "bodhi_update_push_stable",
+                   "product_version": "fedora-32",
+                   "subject_type": "koji_build",
+                   "subject_identifier": "bodhi-5.1.1-1.fc32"
+               },
+               {
+                   "decision_context": "bodhi_update_push_testing",
+                   "product_version": "fedora-32",
+                   "subject_type": "koji_build",
+                   "subject_identifier": "bodhi-5.1.1-1.fc32"
+               },
+               {
+                   "product_version": "fedora-32",
+                   "subject_type": "koji_build",
+                   "subject_identifier": "bodhi-5.1.1-1.fc32"
+               }
+           ]
+       }
+
+    **Sample response**:
+
+    .. sourcecode:: none
+
+       HTTP/1.1 200 OK
+       Content-Type: application/json
+
+       {
+           "decisions": [
+               {
+                   "status": 200,
+                   "decision": {
+                       "policies_satisfied": true,
+                       "summary": "All required tests passed",
+                       "applicable_policies": [ "taskotron_release_critical_tasks_for_stable" ],
+                       "unsatisfied_requirements": [],
+                       "satisfied_requirements": [
+                           {
+                               "result_id": 38088806,
+                               "testcase": "dist.abicheck",
+                               "type": "test-result-passed"
+                           }
+                       ]
+                   }
+               },
+               {
+                   "status": 200,
+                   "decision": {
+                       "policies_satisfied": true,
+                       "summary": "No tests are required",
+                       "applicable_policies": [ "taskotron_release_critical_tasks_for_testing" ],
+                       "unsatisfied_requirements": [],
+                       "satisfied_requirements": []
+                   }
+               },
+               {
+                   "status": 400,
+                   "message": "Either decision_context or rules is required."
+               }
+           ]
+       }
+
+    :jsonparam list decisions: List of decision requests.
+
+    :resjson list decisions: List with a result for each decision request in
+        the same order. Each result contains ``status``, HTTP status code for
+        the decision request, and either ``decision``, the decision response,
+        or ``message``, the error message.
+
+    If the request prefers :mimetype:`application/x-ndjson` in the ``Accept``
+    header, the response is streamed as newline-delimited JSON with a line
+    for each item in ``decisions``.
+
+    :statuscode 200: Decisions were processed.
+    :statuscode 400: Invalid data was given.
+    """  # noqa: E501
+    data = request.get_json()
+    if _accepts_ndjson():
+        lines = greenwave.decision.make_decisions_lines(data, current_app.config)
+        return _ndjson_response(lines)
+
+    responses = greenwave.decision.make_decisions(data, current_app.config)
+    log.debug('Response: %s', responses)
+    resp = jsonify({'decisions': responses})
+    resp = insert_headers(resp)
+    resp.status_code = 200
+    return resp
+
+
 @api.route('/validate-gating-yaml', methods=['POST'])
 @jsonp
 def validate_gating_yaml_post():
@@ -5,6 +5,11 @@ import logging.config
 
 from flask import Flask
 from greenwave.api_v1 import api
+from greenwave.cache import LRUCache, local_caches
+from greenwave.monitor import (
+    remote_policies_cache_hit_counter,
+    remote_policies_cache_miss_counter,
+)
 from greenwave.utils import json_error, load_config, sha1_mangle_key
 from greenwave.policies import load_policies
 from greenwave.subjects.subject_type import load_subject_types
@@ -47,6 +52,7 @@ def create_app(config_obj=None):
     app.register_error_handler(ConnectionError, json_error)
     app.register_error_handler(requests.ConnectionError, json_error)
     app.register_error_handler(requests.Timeout, json_error)
+    app.register_error_handler(requests.HTTPError, json_error)
 
     # register blueprints
     app.register_blueprint(api, url_prefix="/api/v1.0")
@@ -55,6 +61,16 @@ def create_app(config_obj=None):
     # Initialize the cache.
     app.cache = make_region(key_mangler=sha1_mangle_key)
     app.cache.configure(**app.config['CACHE'])
+    app.negative_cache = make_region(key_mangler=sha1_mangle_key)
+    app.negative_cache.configure(**app.config['NEGATIVE_CACHE'])
+    app.local_caches = local_caches(app.config)
+
+    app.remote_policies_cache = LRUCache(
+        maxsize=app.config['REMOTE_RULE_CACHE_SIZE'],
+        ttl=app.config['REMOTE_RULE_CACHE_TTL'],
+        hit_counter=remote_policies_cache_hit_counter,
+        miss_counter=remote_policies_cache_miss_counter,
+    )
 
     return app
 
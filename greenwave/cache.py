@@ -1,18 +1,186 @@
 # SPDX-License-Identifier: GPL-2.0+
 
+import copy
 import functools
+import threading
+import time
+from collections import OrderedDict
+
 import dogpile.cache
 import flask
+from dogpile.cache.api import NO_VALUE
+
+from greenwave.monitor import cache_hit_counter, cache_miss_counter
 
 # Provide a convenient alias for the key generator we want to use
 key_generator = dogpile.cache.util.function_key_generator
 
 
+def local_caches(config):
+    """
+    Returns in-process caches for cached functions configured by LOCAL_CACHE
+    option, keyed by function name.
+    """
+    return {
+        name: LRUCache(
+            hit_counter=cache_hit_counter.labels(tier='local', function=name),
+            miss_counter=cache_miss_counter.labels(tier='local', function=name),
+            **options,
+        )
+        for name, options in config['LOCAL_CACHE'].items()
+    }
+
+
 def cached(fn):
-    """ Cache arguments with a region hung on the flask app. """
+    """
+    Cache arguments with a region hung on the flask app.
+
+    If configured, values are also kept in an in-process cache in front of
+    the region to avoid round trips to the shared cache backend.
+    """
+    name = fn.__name__
+    key_for = key_generator(None, fn)
+    shared_labels = {'tier': 'shared', 'function': name}
+
     @functools.wraps(fn)
     def wrapper(*args):
-        decoration = flask.current_app.cache.cache_on_arguments
-        decorator = decoration(function_key_generator=key_generator)
-        return decorator(fn)(*args)
+        app = flask.current_app
+        key = key_for(*args)
+        local_cache = app.local_caches.get(name)
+        if local_cache is not None:
+            value = local_cache.get(key, NO_VALUE)
+            if value is not NO_VALUE:
+                return value
+
+        created = False
+
+        def create():
+            nonlocal created
+            created = True
+            return fn(*args)
+
+        value = app.cache.get_or_create(key, create)
+        if created:
+            cache_miss_counter.labels(**shared_labels).inc()
+        else:
+            cache_hit_counter.labels(**shared_labels).inc()
+
+        if local_cache is not None:
+            local_cache.set(key, value)
+        return value
     return wrapper
+
+
+def negative_cached(*exception_types):
+    """
+    Cache exceptions of given types raised for arguments with a separate
+    region hung on the flask app.
+
+    The region for such negative results usually has shorter expiration time.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args):
+            region = flask.current_app.negative_cache
+            key = key_generator(None, fn)(*args)
+            error = region.get(key)
+            if error is not NO_VALUE:
+                raise copy.copy(error)
+
+            try:
+                return fn(*args)
+            except exception_types as e:
+                region.set(key, e)
+                raise
+        return wrapper
+    return decorator
+
+
+def cached_value(fn, *args):
+    """
+    Returns value cached for the function arguments or
+    dogpile.cache.api.NO_VALUE.
+    """
+    key = key_generator(None, fn)(*args)
+    app = flask.current_app
+    local_cache = app.local_caches.get(fn.__name__)
+    if local_cache is not None:
+        value = local_cache.get(key, NO_VALUE)
+        if value is not NO_VALUE:
+            return value
+    return app.cache.get(key)
+
+
+def negative_cached_value(fn, *args):
+    """
+    Returns exception cached in negative cache for the function arguments or
+    dogpile.cache.api.NO_VALUE.
+    """
+    key = key_generator(None, fn)(*args)
+    return flask.current_app.negative_cache.get(key)
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache with limited number of items.
+
+    Least recently used items are dropped first. Items expire after given
+    number of seconds (ttl) unless it is None.
+    """
+    def __init__(self, maxsize, ttl=None, hit_counter=None, miss_counter=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hit_counter = hit_counter
+        self.miss_counter = miss_counter
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value, expires_at = self._items.get(key, (_MISSING, None))
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._items[key]
+                value = _MISSING
+
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self._items.move_to_end(key)
+                self.hits += 1
+
+        if value is _MISSING:
+            if self.miss_counter:
+                self.miss_counter.inc()
+            return default
+
+        if self.hit_counter:
+            self.hit_counter.inc()
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
@@ -0,0 +1,165 @@
+# SPDX-License-Identifier: GPL-2.0+
+"""
+Circuit breakers for upstream services.
+
+If too many recent requests to an upstream service failed, the circuit opens
+and further requests fail immediately instead of waiting for timeouts and
+retries. After a while, a single probe request is let through (half-open
+state) and the circuit closes again if it succeeds.
+"""
+import collections
+import logging
+import threading
+import time
+
+from flask import current_app
+
+from greenwave.monitor import (
+    circuit_breaker_rejected_counter,
+    circuit_breaker_state_gauge,
+)
+
+log = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+# Values of the state gauge
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Tokens returned by CircuitBreaker.allow_request()
+REQUEST = 'request'
+PROBE = 'probe'
+
+
+class CircuitBreaker:
+    """
+    Tracks failures of requests to an upstream service.
+
+    Args:
+        upstream (str): Name of the upstream service for logs and metrics
+        failure_rate (float): Ratio of failed requests in the window which
+            opens the circuit
+        min_requests (int): Minimum number of requests in the window needed
+            to open the circuit
+        window (float): Number of seconds for which requests are tracked
+        reset_timeout (float): Number of seconds to keep the circuit open
+            before letting a probe request through
+    """
+    def __init__(self, upstream, failure_rate=0.5, min_requests=20, window=60,
+                 reset_timeout=30):
+        self.upstream = upstream
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._outcomes = collections.deque()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """
+        Returns token for a request allowed to be sent to the upstream
+        service (PROBE for the single request let through while half-open,
+        REQUEST otherwise), or None if the request is rejected.
+
+        Each allowed request must be followed by record() with the token.
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._reject()
+                    return None
+                self._set_state(HALF_OPEN)
+
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    self._reject()
+                    return None
+                self._probing = True
+                return PROBE
+
+            return REQUEST
+
+    def record(self, token, failed):
+        """
+        Records outcome of an allowed request.
+
+        Only the probe request decides whether the half-open circuit closes
+        or opens again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if token == PROBE:
+                self._probing = False
+                if failed:
+                    self._open(now)
+                else:
+                    self._close()
+                return
+
+            # Ignore requests sent before the circuit opened.
+            if self.state != CLOSED:
+                return
+
+            self._outcomes.append((now, failed))
+            self._failures += failed
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                _, old_failed = self._outcomes.popleft()
+                self._failures -= old_failed
+
+            requests = len(self._outcomes)
+            if requests >= self.min_requests and \
+                    self._failures >= self.failure_rate * requests:
+                self._open(now)
+
+    def _open(self, now):
+        log.warning('Opening circuit breaker for %s', self.upstream)
+        self._opened_at = now
+        self._set_state(OPEN)
+
+    def _close(self):
+        log.info('Closing circuit breaker for %s', self.upstream)
+        self._outcomes.clear()
+        self._failures = 0
+        self._set_state(CLOSED)
+
+    def _set_state(self, state):
+        self.state = state
+        circuit_breaker_state_gauge.labels(upstream=self.upstream).set(_STATE_VALUES[state])
+
+    def _reject(self):
+        circuit_breaker_rejected_counter.labels(upstream=self.upstream).inc()
+
+
+# Maps upstream service name and options to circuit breaker shared by all
+# threads (see circuit_breaker()).
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(upstream):
+    """
+    Returns circuit breaker for an upstream service configured by
+    CIRCUIT_BREAKER and CIRCUIT_BREAKER_UPSTREAMS options, or None if circuit
+    breakers are disabled.
+    """
+    if not current_app.config['CIRCUIT_BREAKER_ENABLED']:
+        return None
+
+    options = dict(current_app.config['CIRCUIT_BREAKER'])
+    options.update(current_app.config['CIRCUIT_BREAKER_UPSTREAMS'].get(upstream, {}))
+    key = (upstream, tuple(sorted(options.items())))
+
+    breaker = _circuit_breakers.get(key)
+    if breaker is None:
+        with _circuit_breakers_lock:
+            breaker = _circuit_breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(upstream, **options)
+                _circuit_breakers[key] = breaker
+    return breaker
@@ -37,16 +37,81 @@ class Config(object):
     }
     REMOTE_RULE_GIT_TIMEOUT = 30
     REMOTE_RULE_GIT_MAX_RETRY = 3
+    # In-process cache for parsed remote rule files (keyed by URL and content)
+    REMOTE_RULE_CACHE_SIZE = 1024
+    REMOTE_RULE_CACHE_TTL = 3600
     KOJI_BASE_URL = 'https://koji.fedoraproject.org/kojihub'
     # Options for outbound HTTP requests made by python-requests
     REQUESTS_TIMEOUT = (6.1, 15)
     REQUESTS_VERIFY = True
+    # Connection pool options for outbound HTTP requests (see
+    # greenwave.request_session.get_requests_session()); pool_maxsize should
+    # usually match number of threads making requests concurrently
+    REQUESTS_POOL = {
+        'pool_connections': 10,
+        'pool_maxsize': 10,
+        'pool_block': False,
+    }
+    # Overrides of REQUESTS_POOL for each upstream service: "resultsdb",
+    # "waiverdb" and "dist_git" (Koji uses a persistent XML-RPC connection
+    # for each thread instead of a pool)
+    REQUESTS_UPSTREAM_POOLS = {}
+    # Circuit breakers for upstream services ("resultsdb", "waiverdb",
+    # "dist_git" and "koji"): if at least "failure_rate" of at least
+    # "min_requests" requests in the last "window" seconds failed, requests
+    # fail immediately for "reset_timeout" seconds before a probe request is
+    # let through (see greenwave.circuit_breaker.CircuitBreaker)
+    CIRCUIT_BREAKER_ENABLED = False
+    CIRCUIT_BREAKER = {
+        'failure_rate': 0.5,
+        'min_requests': 20,
+        'window': 60,
+        'reset_timeout': 30,
+    }
+    # Overrides of CIRCUIT_BREAKER for each upstream service
+    CIRCUIT_BREAKER_UPSTREAMS = {}
+    # Time limit in seconds for all outbound HTTP requests made for a single
+    # decision request or message; request timeouts are shortened and retries
+    # are skipped to finish in time (None to disable)
+    DECISION_DEADLINE = None
+    # Send the same request to ResultsDB again if it takes longer than given
+    # percentile of latencies of recent requests, e.g. 95 or 99.5 (None to
+    # disable)
+    RESULTSDB_HEDGE_PERCENTILE = None
+    # Minimum number of recent requests to ResultsDB to start hedging
+    RESULTSDB_HEDGE_MIN_SAMPLES = 20
+    # Maximum number of concurrent requests to ResultsDB for single decision
+    RESULTSDB_MAX_CONCURRENT_REQUESTS = 8
+    # Maximum number of filters in single request to WaiverDB (zero for no
+    # limit); more filters are split into multiple requests
+    WAIVERDB_MAX_FILTERS_PER_REQUEST = 100
+    # Maximum number of concurrent requests to WaiverDB for single decision
+    WAIVERDB_MAX_CONCURRENT_REQUESTS = 4
+    # Start retrieving waivers for all required test cases while retrieving
+    # results instead of only for unsatisfied requirements afterwards (this is
+    # always done for verbose decisions)
+    WAIVERDB_SPECULATIVE_PREFETCH = False
+    # Maximum number of decision requests in single bulk request
+    MAX_DECISIONS_PER_REQUEST = 100
 
     POLICIES_DIR = '/etc/greenwave/policies'
     SUBJECT_TYPES_DIR = '/etc/greenwave/subject_types'
 
     # By default, don't cache anything.
     CACHE = {'backend': 'dogpile.cache.null'}
+    # In-process LRU caches in front of CACHE for functions decorated with
+    # greenwave.cache.cached(), keyed by function name, for example
+    # {'_retrieve_koji_build_attributes': {'maxsize': 1024, 'ttl': 300}}.
+    # Values are shared by all threads, so "ttl" (seconds) should not exceed
+    # expiration time of CACHE.
+    LOCAL_CACHE = {}
+    # Cache all test case results, not only passing ones. Enable only if the
+    # listener or consumer for ResultsDB messages uses the same cache since it
+    # removes cached results of the subject and test case for each new result.
+    CACHE_ALL_RESULTS = False
+    # Cache for missing remote rule files, Koji builds and SCM sources.
+    # Expiration time should be shorter than for CACHE.
+    NEGATIVE_CACHE = {'backend': 'dogpile.cache.null'}
     # Greenwave API url
     GREENWAVE_API_URL = 'https://greenwave.domain.local/api/v1.0'
 
@@ -82,6 +147,17 @@ class Config(object):
         "reconnect_sleep_max": 30.0,
         "reconnect_attempts_max": 10,
     }
+    # Number of worker threads processing messages (if zero, messages are
+    # processed one at a time in the thread receiving them). Messages for the
+    # same subject are always processed in the order they were received.
+    LISTENER_WORKERS = 0
+    # Maximum number of messages received but not processed yet when using
+    # worker threads
+    LISTENER_MAX_PENDING_MESSAGES = 100
+    # Time window in seconds for grouping ResultsDB messages for the same
+    # subject and product version so decision changes are published only once
+    # for the group (zero to disable)
+    LISTENER_RESULTSDB_COALESCE_SECONDS = 0
     LISTENER_CONNECTION_SSL = {
         "key_file": "/etc/pki/umb/umb-key",
         "cert_file": "/etc/pki/umb/umb-crt",
@@ -69,6 +69,8 @@ class Consumer:
         Args:
             hub (moksha.hub.hub.CentralMokshaHub): The hub from which this handler is consuming
                 messages. It is used to look up the hub config.
+            flask_app (flask.Flask): Optional Flask app shared with other
+                consumers; if unset, new app is created using "config".
         """
 
         prefix = hub.config.get('topic_prefix')
@@ -77,8 +79,9 @@ class Consumer:
         self.topic = ['.'.join([prefix, env, suffix])]
 
         config = kwargs.pop('config', None)
+        flask_app = kwargs.pop('flask_app', None)
 
-        self.flask_app = greenwave.app_factory.create_app(config)
+        self.flask_app = flask_app or greenwave.app_factory.create_app(config)
         self.greenwave_api_url = self.flask_app.config['GREENWAVE_API_URL']
         log.info('Greenwave handler listening on: %s', self.topic)
 
@@ -125,22 +128,26 @@ class Consumer:
             log.exception('Error sending fedora-messaging message')
             self._inc(messaging_tx_failed_counter)
 
-    def _old_and_new_decisions(self, submit_time, **request_data):
-        """Returns decision before and after submit time."""
-        greenwave_url = self.greenwave_api_url + '/decision'
-        log.debug('querying greenwave at: %s', greenwave_url)
-
+    def _old_and_new_decisions(self, submit_time, subject, contexts_product_versions):
+        """
+        Returns decisions before and after submit time for all decision
+        contexts and product versions.
+        """
         try:
-            decision = greenwave.decision.make_decision(request_data, self.flask_app.config)
-
-            request_data['when'] = right_before_this_time(submit_time)
-            old_decision = greenwave.decision.make_decision(request_data, self.flask_app.config)
-            log.debug('old decision: %s', old_decision)
+            # The old decisions reuse results and waivers retrieved for the
+            # new ones unless there are any newer than the submit time.
+            decisions = greenwave.decision.make_subject_decisions(
+                subject, contexts_product_versions, self.flask_app.config)
+
+            when = right_before_this_time(submit_time)
+            old_decisions = greenwave.decision.make_subject_decisions(
+                subject, contexts_product_versions, self.flask_app.config, when)
+            log.debug('old decisions: %s', old_decisions)
         except requests.exceptions.HTTPError as e:
-            log.exception('Failed to retrieve decision for data=%s, error: %s', request_data, e)
+            log.exception('Failed to retrieve decisions for subject=%s, error: %s', subject, e)
             return None, None
 
-        return old_decision, decision
+        return old_decisions, decisions
 
     def _publish_decision_change(
             self,
@@ -159,21 +166,22 @@ class Consumer:
             policy_attributes['product_version'] = product_version
 
         policies = self.flask_app.config['policies']
-        contexts_product_versions = applicable_decision_context_product_version_pairs(
-            policies, **policy_attributes)
-
-        for decision_context, product_version in sorted(contexts_product_versions):
-            old_decision, decision = self._old_and_new_decisions(
-                submit_time,
-                decision_context=decision_context,
-                product_version=product_version,
-                subject_type=subject.type,
-                subject_identifier=subject.identifier,
-            )
-            if decision is None:
+        contexts_product_versions = sorted(applicable_decision_context_product_version_pairs(
+            policies, **policy_attributes))
+        if not contexts_product_versions:
+            return
+
+        old_decisions, decisions = self._old_and_new_decisions(
+            submit_time, subject, contexts_product_versions)
+
+        for decision_context, product_version in contexts_product_versions:
+            if decisions is None:
                 self._inc(decision_failed_counter.labels(decision_context=decision_context))
                 continue
 
+            old_decision = old_decisions[(decision_context, product_version)]
+            decision = decisions[(decision_context, product_version)]
+
             if _is_decision_unchanged(old_decision, decision):
                 log.debug('Decision unchanged: %s', decision)
                 self._inc(decision_unchanged_counter.labels(decision_context=decision_context))
@@ -10,7 +10,9 @@ to re-use the same code path.
 """
 
 import logging
+import threading
 
+import greenwave.app_factory
 from greenwave.consumers.resultsdb import ResultsDBHandler
 from greenwave.consumers.waiverdb import WaiverDBHandler
 from greenwave.monitor import (
@@ -32,6 +34,30 @@ class Dummy(object):
         self.config = config
 
 
+# Flask app and handlers are created only once per process so that loaded
+# configuration, policies and caches are reused for all messages.
+_flask_app = None
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def _get_handler(handler_class, config):
+    """
+    Returns handler of given class and hub configuration shared by all
+    messages.
+    """
+    global _flask_app  # pylint: disable=global-statement
+    key = (handler_class, tuple(sorted(config.items())))
+    with _handlers_lock:
+        handler = _handlers.get(key)
+        if handler is None:
+            if _flask_app is None:
+                _flask_app = greenwave.app_factory.create_app()
+            handler = handler_class(Dummy(config), flask_app=_flask_app)
+            _handlers[key] = handler
+        return handler
+
+
 def fedora_messaging_callback(message):
     """
     Callback called when messages from fedora-messaging are received.
@@ -53,8 +79,7 @@ def fedora_messaging_callback(message):
             "environment": consumer_config["environment"],
             "resultsdb_topic_suffix": consumer_config["resultsdb_topic_suffix"]
         }
-        hub = Dummy(config)
-        handler = ResultsDBHandler(hub)
+        handler = _get_handler(ResultsDBHandler, config)
         msg = {"body": {'msg': message.body}}
         log.info('Sending message received to: ResultsDBHandler')
         try:
@@ -74,8 +99,7 @@ def fedora_messaging_callback(message):
             "environment": consumer_config["environment"],
             "waiverdb_topic_suffix": consumer_config["waiverdb_topic_suffix"]
         }
-        hub = Dummy(config)
-        handler = WaiverDBHandler(hub)
+        handler = _get_handler(WaiverDBHandler, config)
         msg = {"body": {'msg': message.body}}
         log.info('Sending message received to: WaiverDBHandler')
         try:
@@ -13,6 +13,7 @@ import logging
 
 from greenwave.consumers.consumer import Consumer
 from greenwave.product_versions import subject_product_version
+from greenwave.resources import ResultsRetriever
 from greenwave.subjects.factory import (
     create_subject_from_data,
     UnknownSubjectDataError,
@@ -113,6 +114,10 @@ class ResultsDBHandler(Consumer):
         except KeyError:
             submit_time = msg['result']['submit_time']
 
+        subject = self.announcement_subject(message)
+        if subject is not None:
+            ResultsRetriever.invalidate_external_cache(subject, testcase, submit_time)
+
         outcome = msg.get('outcome')
         if outcome in self.flask_app.config['OUTCOMES_INCOMPLETE']:
             log.debug('Assuming no decision change on outcome %r', outcome)
@@ -120,7 +125,6 @@ class ResultsDBHandler(Consumer):
 
         brew_task_id = _get_brew_task_id(msg)
 
-        subject = self.announcement_subject(message)
         if subject is None:
             return
 
@@ -134,6 +138,7 @@ class ResultsDBHandler(Consumer):
 
         log.debug('Guessed product version: %r', product_version)
 
+        ResultsRetriever.refresh_external_cache(subject, [testcase])
         self._publish_decision_change(
             submit_time=submit_time,
             subject=subject,
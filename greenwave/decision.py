@@ -2,6 +2,7 @@
 import logging
 import datetime
 
+from flask import current_app, g
 from werkzeug.exceptions import (
     BadRequest,
     NotFound,
@@ -9,16 +10,23 @@ from werkzeug.exceptions import (
 )
 
 from greenwave.policies import (
+    matching_policies,
     summarize_answers,
     OnDemandPolicy,
 )
-from greenwave.resources import ResultsRetriever, WaiversRetriever
+from greenwave.request_session import start_deadline
+from greenwave.resources import (
+    prefetch_koji_builds,
+    ResultsRetriever,
+    WaiversRetriever,
+)
 from greenwave.subjects.factory import (
     create_subject,
     create_subject_from_data,
     UnknownSubjectDataError,
 )
-from greenwave.waivers import waive_answers
+from greenwave.utils import HANDLED_ERRORS, error_message_and_status
+from greenwave.waivers import filter_waivers, waive_answers
 
 log = logging.getLogger(__name__)
 
@@ -33,10 +41,25 @@ class RuleContext:
         self.subject = subject
         self.results_retriever = results_retriever
         self.verified_rules = set()
+        self.remote_sub_policies = {}
 
     def get_results(self, test_case_name):
         return self.results_retriever.retrieve(self.subject, test_case_name)
 
+    def prefetch_results(self, policies):
+        """
+        Marks results for test cases required by the policies to be retrieved
+        together with the first requested one.
+        """
+        test_case_names = {
+            test_case_name
+            for policy in policies
+            for test_case_name in policy.test_case_names(self)
+        }
+        if test_case_names:
+            self.results_retriever.prefetch(self.subject, test_case_names)
+        return test_case_names
+
     def verify(self, policy, rule):
         if rule in self.verified_rules:
             return []
@@ -50,67 +73,171 @@ class Decision:
     """
     Collects answers from rules from policies.
     """
-    def __init__(self, decision_context, product_version, verbose=False):
+    def __init__(self, decision_context, product_version, verbose=False,
+                 remote_sub_policies=None):
         self.decision_context = decision_context
         self.product_version = product_version
         self.verbose = verbose
 
-        self.verbose_results = []
+        # Pairs of results retriever and subject for verbose output (see
+        # verbose_results()).
+        self.verbose_result_sources = []
         self.waivers = []
         self.waiver_filters = []
         self.answers = []
         self.applicable_policies = []
+        self.rule_contexts = []
+
+        # Maps subject to policies parsed from its remote rule file; this can
+        # be shared with other decisions for the same subjects.
+        if remote_sub_policies is None:
+            remote_sub_policies = {}
+        self.remote_sub_policies = remote_sub_policies
 
     def check(self, subject, policies, results_retriever):
-        subject_policies = [
-            policy for policy in policies
-            if policy.matches(
+        self.check_subjects([subject], policies, results_retriever)
+
+    def check_subjects(self, subjects, policies, results_retriever):
+        """
+        Checks policies for all subjects.
+        """
+        self.prepare(subjects, policies, results_retriever)
+        self.evaluate()
+
+    def prepare(self, subjects, policies, results_retriever, waivers_retriever=None):
+        """
+        Finds policies applicable to the subjects and marks required results
+        to be retrieved.
+
+        Results required by all subjects (and any other decision prepared
+        with the same results retriever) are requested before evaluating any
+        rule so these can be retrieved together.
+
+        If waivers retriever is passed, waivers which will likely be needed
+        are marked to be prefetched (see WaiversRetriever.prefetch()).
+        """
+        speculate_waivers = waivers_retriever is not None and (
+            self.verbose or current_app.config['WAIVERDB_SPECULATIVE_PREFETCH'])
+        subjects = list(subjects)
+        koji_builds = [
+            subject.identifier for subject in subjects
+            if subject.is_koji_build and any(
+                policy.requires_koji_build and policy.matches_subject_type(subject=subject)
+                for policy in policies
+            )
+        ]
+        if koji_builds:
+            prefetch_koji_builds(koji_builds, current_app.config['KOJI_BASE_URL'])
+
+        for subject in subjects:
+            subject_policies = matching_policies(
+                policies,
                 decision_context=self.decision_context,
                 product_version=self.product_version,
                 subject=subject)
-        ]
-
-        if not subject_policies:
-            if subject.ignore_missing_policy:
-                return
-
-            raise NotFound(
-                'Cannot find any applicable policies for %s subjects at gating point %s in %s' % (
-                    subject.type, self.decision_context, self.product_version))
 
+            if not subject_policies:
+                if subject.ignore_missing_policy:
+                    continue
+
+                raise NotFound(
+                    'Cannot find any applicable policies for %s subjects at gating point %s in %s'
+                    % (subject.type, self.decision_context, self.product_version))
+
+            rule_context = RuleContext(self.product_version, subject, results_retriever)
+            rule_context.remote_sub_policies = self.remote_sub_policies.setdefault(
+                (subject.type, subject.identifier), {})
+            if self.verbose:
+                # Retrieve test results for all items when verbose output is requested.
+                results_retriever.prefetch(subject)
+                waiver_filters = [self._subject_waiver_filter(subject)]
+            else:
+                test_case_names = rule_context.prefetch_results(subject_policies)
+                waiver_filters = [
+                    self._test_case_waiver_filter(subject, test_case_name)
+                    for test_case_name in sorted(test_case_names)
+                ]
+            if speculate_waivers:
+                waivers_retriever.prefetch(waiver_filters)
+            self.rule_contexts.append((rule_context, subject_policies))
+
+    def _subject_waiver_filter(self, subject):
+        return {
+            "subject_type": subject.type,
+            "subject_identifier": subject.identifier,
+            "product_version": self.product_version,
+        }
+
+    def _test_case_waiver_filter(self, subject, test_case_name):
+        return {
+            "subject_type": subject.type,
+            "subject_identifier": subject.identifier,
+            "product_version": self.product_version,
+            "testcase": test_case_name,
+        }
+
+    def evaluate(self):
+        """
+        Checks policies for prepared subjects.
+        """
+        rule_contexts = self.rule_contexts
+        self.rule_contexts = []
+
+        for rule_context, subject_policies in rule_contexts:
+            subject = rule_context.subject
+            if self.verbose:
+                # Retrieve test results and waivers for all items when verbose output is requested.
+                # Retrieve now so errors are raised before streaming the
+                # response; verbose_results() reads the retriever cache.
+                rule_context.results_retriever.retrieve(subject)
+                self.verbose_result_sources.append((rule_context.results_retriever, subject))
+                self.waiver_filters.append(self._subject_waiver_filter(subject))
+
+            for policy in subject_policies:
+                self.answers.extend(policy.check(rule_context))
+
+            self.applicable_policies.extend(subject_policies)
+
+    def verbose_results(self):
+        """
+        Yields test results for all subjects for verbose output, each only
+        once.
+
+        Results are read from the results retriever cache for one subject at
+        a time instead of being copied to the decision.
+        """
+        seen_ids = set()
+        for results_retriever, subject in self.verbose_result_sources:
+            for result in results_retriever.retrieve(subject):
+                if result['id'] not in seen_ids:
+                    seen_ids.add(result['id'])
+                    yield result
+
+    def collect_waiver_filters(self):
+        """
+        Adds filters for waivers of unsatisfied answers.
+        """
         if self.verbose:
-            # Retrieve test results and waivers for all items when verbose output is requested.
-            self.verbose_results.extend(results_retriever.retrieve(subject))
-            self.waiver_filters.append(dict(
-                subject_type=subject.type,
-                subject_identifier=subject.identifier,
-                product_version=self.product_version,
-            ))
+            return
 
-        rule_context = RuleContext(self.product_version, subject, results_retriever)
-        for policy in subject_policies:
-            self.answers.extend(policy.check(rule_context))
-
-        self.applicable_policies.extend(subject_policies)
+        for answer in self.answers:
+            if not answer.is_satisfied:
+                waiver = self._test_case_waiver_filter(answer.subject, answer.test_case_name)
+                if waiver not in self.waiver_filters:
+                    self.waiver_filters.append(waiver)
 
     def waive_answers(self, waivers_retriever):
-        if not self.verbose:
-            for answer in self.answers:
-                if not answer.is_satisfied:
-                    waiver = {
-                        "subject_type": answer.subject.type,
-                        "subject_identifier": answer.subject.identifier,
-                        "product_version": self.product_version,
-                        "testcase": answer.test_case_name,
-                    }
-                    if waiver not in self.waiver_filters:
-                        self.waiver_filters.append(waiver)
+        self.collect_waiver_filters()
 
         if self.waiver_filters:
-            self.waivers = waivers_retriever.retrieve(self.waiver_filters)
+            waivers = waivers_retriever.retrieve(self.waiver_filters)
         else:
-            self.waivers = []
+            waivers = []
+
+        self.apply_waivers(waivers)
 
+    def apply_waivers(self, waivers):
+        self.waivers = waivers
         self.answers = waive_answers(self.answers, self.waivers)
 
     def policies_satisfied(self):
@@ -162,7 +289,81 @@ def _decision_subjects_for_request(data):
         yield create_subject(data['subject_type'], data['subject_identifier'])
 
 
-def make_decision(data, config):
+def _create_retrievers(config, when, ignore_results, ignore_waivers):
+    retriever_args = {'when': when}
+    results_retriever = ResultsRetriever(
+        ignore_ids=ignore_results,
+        url=config['RESULTSDB_API_URL'],
+        **retriever_args)
+    waivers_retriever = WaiversRetriever(
+        ignore_ids=ignore_waivers,
+        url=config['WAIVERDB_API_URL'],
+        max_filters_per_request=config['WAIVERDB_MAX_FILTERS_PER_REQUEST'],
+        max_concurrent_requests=config['WAIVERDB_MAX_CONCURRENT_REQUESTS'],
+        **retriever_args)
+    return results_retriever, waivers_retriever
+
+
+class SharedRetrievers:
+    """
+    Creates retrievers for multiple decision requests which share retrieved
+    results and waivers if the requests have the same "when" parameter.
+
+    Retrievers for requests with "when" parameter reuse data retrieved for
+    requests without it if nothing was submitted after "when". This allows
+    to get decision before and after a new result or waiver without
+    retrieving the same data twice (the latest decision must be made first).
+    """
+    def __init__(self, config):
+        self.config = config
+        self.retrievers = {}
+        # Policies from remote rule files for subjects.
+        self.remote_sub_policies = {}
+
+    def get(self, when):
+        """
+        Returns results and waivers retriever (without ignored ids) shared
+        by all requests with given "when" parameter.
+        """
+        retrievers = self.retrievers.get(when)
+        if retrievers is None:
+            retrievers = _create_retrievers(self.config, when, [], [])
+            if when:
+                latest_retrievers = self.get(None)
+                for retriever, latest_retriever in zip(retrievers, latest_retrievers):
+                    retriever.latest = latest_retriever
+            self.retrievers[when] = retrievers
+        return retrievers
+
+    def create(self, when, ignore_results, ignore_waivers):
+        results_retriever, waivers_retriever = self.get(when)
+        return (
+            results_retriever.with_ignore_ids(ignore_results),
+            waivers_retriever.with_ignore_ids(ignore_waivers),
+        )
+
+
+def _app_context_retrievers(config):
+    """
+    Returns retrievers shared by all decisions made in the current app
+    context, i.e. in a single HTTP request or for a single consumed message.
+    """
+    if 'shared_retrievers' not in g:
+        g.shared_retrievers = SharedRetrievers(config)
+        # The deadline applies to all requests made for the decisions.
+        start_deadline(config['DECISION_DEADLINE'])
+    return g.shared_retrievers
+
+
+def _prepare_decision(data, config, retrievers=None):
+    """
+    Validates decision request data and returns the prepared Decision, the
+    waivers retriever and on-demand rules for the request.
+
+    Retrieved data and parsed remote rule files are shared with other
+    decisions prepared with the same retrievers (SharedRetrievers), by
+    default with all decisions in the current app context.
+    """
     if not data:
         raise UnsupportedMediaType('No JSON payload in request')
 
@@ -202,23 +403,20 @@ def make_decision(data, config):
         except ValueError:
             raise BadRequest('Invalid "when" parameter, must be in ISO8601 format')
 
-    retriever_args = {'when': when}
-    results_retriever = ResultsRetriever(
-        ignore_ids=ignore_results,
-        url=config['RESULTSDB_API_URL'],
-        **retriever_args)
-    waivers_retriever = WaiversRetriever(
-        ignore_ids=ignore_waivers,
-        url=config['WAIVERDB_API_URL'],
-        **retriever_args)
+    if retrievers is None:
+        retrievers = _app_context_retrievers(config)
+    results_retriever, waivers_retriever = retrievers.create(
+        when, ignore_results, ignore_waivers)
 
     policies = on_demand_policies or config['policies']
-    decision = Decision(decision_context, product_version, verbose)
-    for subject in _decision_subjects_for_request(data):
-        decision.check(subject, policies, results_retriever)
+    decision = Decision(
+        decision_context, product_version, verbose, retrievers.remote_sub_policies)
+    decision.prepare(
+        _decision_subjects_for_request(data), policies, results_retriever, waivers_retriever)
+    return decision, waivers_retriever, rules
 
-    decision.waive_answers(waivers_retriever)
 
+def _decision_response(decision, rules):
     response = {
         'policies_satisfied': decision.policies_satisfied(),
         'summary': decision.summary(),
@@ -231,10 +429,215 @@ def make_decision(data, config):
         response.update({'applicable_policies': [
             policy.id for policy in decision.applicable_policies]})
 
-    if verbose:
+    if decision.verbose:
         response.update({
-            'results': list({result['id']: result for result in decision.verbose_results}.values()),
+            'results': list(decision.verbose_results()),
             'waivers': list({waiver['id']: waiver for waiver in decision.waivers}.values()),
         })
 
     return response
+
+
+def _decision_response_lines(decision, rules):
+    """
+    Yields decision response split into multiple items, starting with
+    decision summary followed by requirements and verbose results and
+    waivers, one per item.
+    """
+    response = {
+        'policies_satisfied': decision.policies_satisfied(),
+        'summary': decision.summary(),
+    }
+    if not rules:
+        response['applicable_policies'] = [
+            policy.id for policy in decision.applicable_policies]
+    yield response
+
+    for answer in decision.answers:
+        if answer.is_satisfied:
+            yield {'satisfied_requirement': answer.to_json()}
+
+    for answer in decision.answers:
+        if not answer.is_satisfied:
+            yield {'unsatisfied_requirement': answer.to_json()}
+
+    if decision.verbose:
+        for result in decision.verbose_results():
+            yield {'result': result}
+
+        seen_ids = set()
+        for waiver in decision.waivers:
+            if waiver['id'] not in seen_ids:
+                seen_ids.add(waiver['id'])
+                yield {'waiver': waiver}
+
+
+def _make_decision(data, config):
+    decision, waivers_retriever, rules = _prepare_decision(data, config)
+    waivers_retriever.start_prefetch()
+    decision.evaluate()
+    decision.waive_answers(waivers_retriever)
+    return decision, rules
+
+
+def make_decision(data, config):
+    decision, rules = _make_decision(data, config)
+    return _decision_response(decision, rules)
+
+
+def make_decision_lines(data, config):
+    """
+    Makes decision and returns generator of response items (see
+    _decision_response_lines()) suitable for streaming.
+    """
+    decision, rules = _make_decision(data, config)
+    return _decision_response_lines(decision, rules)
+
+
+def _error_response(error):
+    message, status_code = error_message_and_status(error)
+    return {'status': status_code, 'message': message}
+
+
+def _make_decisions(requests_data, config, on_error):
+    """
+    Makes decisions for multiple decision requests.
+
+    Results, waivers, Koji builds and remote rule files are retrieved only
+    once for all the requests and results for all subjects are requested
+    together.
+
+    Returns list with a pair of Decision and on-demand rules or an error
+    response, returned by on_error(exception), for each request.
+    """
+    retrievers = _app_context_retrievers(config)
+    responses = [None] * len(requests_data)
+
+    prepared = []
+    for index, request_data in enumerate(requests_data):
+        try:
+            decision, waivers_retriever, rules = _prepare_decision(
+                request_data, config, retrievers)
+        except HANDLED_ERRORS as e:
+            responses[index] = on_error(e)
+        else:
+            prepared.append((index, decision, waivers_retriever, rules, request_data.get('when')))
+
+    for _, waivers_retriever in retrievers.retrievers.values():
+        waivers_retriever.start_prefetch()
+
+    evaluated = []
+    for item in prepared:
+        index, decision, *_ = item
+        try:
+            decision.evaluate()
+        except HANDLED_ERRORS as e:
+            responses[index] = on_error(e)
+        else:
+            decision.collect_waiver_filters()
+            evaluated.append(item)
+
+    # Retrieve waivers for all decisions with the same "when" parameter at once.
+    by_when = {}
+    for item in evaluated:
+        by_when.setdefault(item[4], []).append(item)
+
+    for when, items in by_when.items():
+        filters = []
+        for _, decision, *_ in items:
+            filters.extend(
+                waiver_filter for waiver_filter in decision.waiver_filters
+                if waiver_filter not in filters)
+
+        try:
+            _, waivers_retriever = retrievers.get(when)
+            waivers = waivers_retriever.retrieve([dict(f) for f in filters]) if filters else []
+        except HANDLED_ERRORS as e:
+            for index, *_ in items:
+                responses[index] = on_error(e)
+            continue
+
+        for index, decision, waivers_retriever, rules, _ in items:
+            decision.apply_waivers([
+                waiver for waiver in filter_waivers(waivers, decision.waiver_filters)
+                if waiver['id'] not in waivers_retriever.ignore_ids
+            ])
+            responses[index] = (decision, rules)
+
+    return responses
+
+
+def _raise_error(error):
+    raise error
+
+
+def make_subject_decisions(subject, contexts_product_versions, config, when=None):
+    """
+    Makes decisions for a subject in all given decision contexts and product
+    versions at once.
+
+    Retrieved data and parsed remote rule files are shared between the
+    decisions and with other decisions in the current app context.
+
+    Returns dict mapping (decision_context, product_version) to decision
+    response. Any error is raised.
+    """
+    contexts_product_versions = list(contexts_product_versions)
+    requests_data = []
+    for decision_context, product_version in contexts_product_versions:
+        request_data = {
+            'decision_context': decision_context,
+            'product_version': product_version,
+            'subject_type': subject.type,
+            'subject_identifier': subject.identifier,
+        }
+        if when:
+            request_data['when'] = when
+        requests_data.append(request_data)
+
+    responses = _make_decisions(requests_data, config, _raise_error)
+    return {
+        context_product_version: _decision_response(decision, rules)
+        for context_product_version, (decision, rules)
+        in zip(contexts_product_versions, responses)
+    }
+
+
+def make_decisions(data, config):
+    """
+    Makes decisions for multiple decision requests.
+
+    Returns list with a response or an error for each request.
+    """
+    return list(make_decisions_lines(data, config))
+
+
+def make_decisions_lines(data, config):
+    """
+    Makes decisions for multiple decision requests and returns generator of
+    responses, which are created only once requested.
+    """
+    if not data:
+        raise UnsupportedMediaType('No JSON payload in request')
+
+    requests_data = data.get('decisions') if isinstance(data, dict) else None
+    if (not isinstance(requests_data, list) or not requests_data or
+            not all(isinstance(entry, dict) for entry in requests_data)):
+        raise BadRequest('Invalid decisions, must be a non-empty list of dicts')
+
+    max_decisions = config['MAX_DECISIONS_PER_REQUEST']
+    if len(requests_data) > max_decisions:
+        raise BadRequest(f'Too many decisions requested, maximum is {max_decisions}')
+
+    responses = _make_decisions(requests_data, config, _error_response)
+
+    def generate():
+        for index, response in enumerate(responses):
+            if isinstance(response, tuple):
+                decision, rules = response
+                response = {'status': 200, 'decision': _decision_response(decision, rules)}
+                # Drop decision data once not needed.
+                responses[index] = None
+            yield response
+
+    return generate()
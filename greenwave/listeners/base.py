@@ -22,6 +22,7 @@ from greenwave.monitor import (
     messaging_tx_failed_counter,
     messaging_tx_sent_ok_counter,
 )
+from greenwave.listeners.workers import OrderedWorkerPool
 from greenwave.policies import applicable_decision_context_product_version_pairs
 from greenwave.utils import right_before_this_time
 
@@ -84,6 +85,13 @@ class BaseListener(stomp.ConnectionListener):
 
         self.destination = self.app.config["LISTENER_DECISION_UPDATE_DESTINATION"]
 
+        workers = self.app.config["LISTENER_WORKERS"]
+        self.max_pending_messages = self.app.config["LISTENER_MAX_PENDING_MESSAGES"]
+        if workers > 0:
+            self.worker_pool = OrderedWorkerPool(workers, self.max_pending_messages)
+        else:
+            self.worker_pool = None
+
     def on_error(self, frame):
         self.app.logger.warning("Received an error: %s", frame.body)
 
@@ -94,7 +102,6 @@ class BaseListener(stomp.ConnectionListener):
                 return
 
         self.app.logger.debug("Received a message: %s", frame.body)
-        _send_ack(self, frame.headers)
         self._inc(messaging_rx_counter)
 
         try:
@@ -102,20 +109,43 @@ class BaseListener(stomp.ConnectionListener):
         except json.JSONDecodeError as e:
             self.app.logger.debug("Failed to decode JSON message: %s", e)
             self._inc(messaging_rx_ignored_counter)
+            _send_ack(self, frame.headers)
             return
 
+        if self.worker_pool is None:
+            self._process_message(frame.headers, data)
+        else:
+            self.worker_pool.submit(
+                self._ordering_key(data), self._process_message, frame.headers, data
+            )
+
+    def _process_message(self, headers, data):
+        """
+        Consumes the message and acknowledges it only if it was processed
+        successfully.
+        """
         try:
             with self.app.app_context():
                 processed = self._consume_message(data)
         except BaseException:
             self._inc(messaging_rx_failed_counter)
+            _send_nack(self, headers)
             raise
 
+        _send_ack(self, headers)
+
         if processed:
             self._inc(messaging_rx_processed_ok_counter)
         else:
             self._inc(messaging_rx_ignored_counter)
 
+    def _ordering_key(self, message):
+        """
+        Returns key for messages which must be processed in order they were
+        received, or None if order does not matter.
+        """
+        return None
+
     def connect(self):
         with self.connection_condition:
             if self.connecting or self.connection.is_connected():
@@ -132,8 +162,13 @@ class BaseListener(stomp.ConnectionListener):
                 self.connecting = False
 
     def subscribe(self):
+        kwargs = {}
+        if self.worker_pool is not None:
+            # Allow broker to send more messages before previous ones are
+            # acknowledged.
+            kwargs["headers"] = {"activemq.prefetchSize": self.max_pending_messages}
         self.connection.subscribe(
-            destination=self.topic, id=self.uid, ack="client-individual"
+            destination=self.topic, id=self.uid, ack="client-individual", **kwargs
         )
         self.app.logger.debug("Subscribed %s to %s", self.uid, self.topic)
 
@@ -186,8 +221,16 @@ class BaseListener(stomp.ConnectionListener):
         self.app.logger.debug("Disconnecting listener")
         with self.connection_condition:
             self.stop = True
+        self._finish_pending_messages()
+        with self.connection_condition:
             self.connection.disconnect()
 
+    def _finish_pending_messages(self):
+        """
+        Called before disconnecting to process messages received but not
+        acknowledged yet.
+        """
+
     def _terminate(self):
         self.disconnect()
         os.kill(os.getpid(), signal.SIGQUIT)
@@ -223,53 +266,80 @@ class BaseListener(stomp.ConnectionListener):
 
         self._inc(messaging_tx_sent_ok_counter)
 
-    def _old_and_new_decisions(self, submit_time, **request_data):
-        """Returns decision before and after submit time."""
+    def _old_and_new_decisions(self, submit_time, subject, contexts_product_versions):
+        """
+        Returns decisions before and after submit time for all decision
+        contexts and product versions.
+        """
         try:
-            decision = greenwave.decision.make_decision(request_data, self.app.config)
+            # The old decisions reuse results and waivers retrieved for the
+            # new ones unless there are any newer than the submit time.
+            decisions = greenwave.decision.make_subject_decisions(
+                subject, contexts_product_versions, self.app.config
+            )
 
-            request_data["when"] = right_before_this_time(submit_time)
-            old_decision = greenwave.decision.make_decision(
-                request_data, self.app.config
+            when = right_before_this_time(submit_time)
+            old_decisions = greenwave.decision.make_subject_decisions(
+                subject, contexts_product_versions, self.app.config, when
             )
-            self.app.logger.debug("old decision: %s", old_decision)
+            self.app.logger.debug("old decisions: %s", old_decisions)
         except HTTPError as e:
             self.app.logger.exception(
-                "Failed to retrieve decision for data=%s, error: %s", request_data, e
+                "Failed to retrieve decisions for subject=%s, error: %s", subject, e
             )
             return None, None
 
-        return old_decision, decision
+        return old_decisions, decisions
 
     def _publish_decision_change(
         self, submit_time, subject, testcase, product_version, publish_testcase
     ):
-
-        policy_attributes = dict(
+        self._publish_decision_changes(
+            submit_time=submit_time,
             subject=subject,
-            testcase=testcase,
+            testcases=[testcase],
+            product_version=product_version,
+            published_testcase=testcase if publish_testcase else None,
         )
 
-        if product_version:
-            policy_attributes["product_version"] = product_version
-
+    def _publish_decision_changes(
+        self, submit_time, subject, testcases, product_version, published_testcase=None
+    ):
+        """
+        Publishes changes of decisions for all decision contexts applicable
+        to any of the test cases since the submit time.
+        """
         policies = self.app.config["policies"]
-        contexts_product_versions = applicable_decision_context_product_version_pairs(
-            policies, **policy_attributes
-        )
+        contexts_product_versions = set()
+        for testcase in testcases:
+            policy_attributes = dict(
+                subject=subject,
+                testcase=testcase,
+            )
+
+            if product_version:
+                policy_attributes["product_version"] = product_version
 
-        for decision_context, product_version in sorted(contexts_product_versions):
-            old_decision, decision = self._old_and_new_decisions(
-                submit_time,
-                decision_context=decision_context,
-                product_version=product_version,
-                subject_type=subject.type,
-                subject_identifier=subject.identifier,
+            contexts_product_versions.update(
+                applicable_decision_context_product_version_pairs(policies, **policy_attributes)
             )
-            if decision is None:
+
+        contexts_product_versions = sorted(contexts_product_versions)
+        if not contexts_product_versions:
+            return
+
+        old_decisions, decisions = self._old_and_new_decisions(
+            submit_time, subject, contexts_product_versions
+        )
+
+        for decision_context, product_version in contexts_product_versions:
+            if decisions is None:
                 self._inc(decision_failed_counter.labels(decision_context=decision_context))
                 continue
 
+            old_decision = old_decisions[(decision_context, product_version)]
+            decision = decisions[(decision_context, product_version)]
+
             if _is_decision_unchanged(old_decision, decision):
                 self.app.logger.debug(
                     "Skipped emitting fedora message, decision did not change: %s", decision
@@ -290,8 +360,8 @@ class BaseListener(stomp.ConnectionListener):
                     "previous": old_decision,
                 }
             )
-            if publish_testcase:
-                decision["testcase"] = testcase
+            if published_testcase:
+                decision["testcase"] = published_testcase
 
             self.app.logger.info("Publishing decision change message: %r", decision)
             self._publish_decision_update(decision)
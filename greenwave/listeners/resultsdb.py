@@ -1,10 +1,18 @@
 # SPDX-License-Identifier: GPL-2.0+
-from greenwave.listeners.base import BaseListener
+from greenwave.listeners.base import BaseListener, _send_ack, _send_nack
+from greenwave.listeners.workers import Coalescer, OrderedWorkerPool
+from greenwave.monitor import (
+    messaging_rx_failed_counter,
+    messaging_rx_ignored_counter,
+    messaging_rx_processed_ok_counter,
+)
 from greenwave.product_versions import subject_product_version
+from greenwave.resources import ResultsRetriever
 from greenwave.subjects.factory import (
     create_subject_from_data,
     UnknownSubjectDataError,
 )
+from greenwave.utils import right_before_this_time
 
 
 def _unpack_value(value):
@@ -37,6 +45,18 @@ class ResultsDBListener(BaseListener):
         self.topic = self.app.config["LISTENER_RESULTSDB_QUEUE"]
         self.koji_base_url = self.app.config["KOJI_BASE_URL"]
 
+        coalesce_seconds = self.app.config["LISTENER_RESULTSDB_COALESCE_SECONDS"]
+        if coalesce_seconds > 0:
+            # Coalesced messages are processed by the worker threads, or by a
+            # single thread if there are none, in order for each subject.
+            self.flush_pool = self.worker_pool or OrderedWorkerPool(
+                1, self.max_pending_messages
+            )
+            self.coalescer = Coalescer(coalesce_seconds, self._submit_coalesced)
+        else:
+            self.flush_pool = None
+            self.coalescer = None
+
     @staticmethod
     def announcement_subject(msg):
         """
@@ -70,7 +90,23 @@ class ResultsDBListener(BaseListener):
 
         return subject
 
-    def _consume_message(self, msg):
+    def _ordering_key(self, message):
+        with self.app.app_context():
+            try:
+                subject = self.announcement_subject(message)
+            except (KeyError, TypeError, AttributeError):
+                return None
+
+        if subject is None:
+            return None
+
+        return subject.identifier
+
+    def _decision_change(self, msg):
+        """
+        Returns arguments for _publish_decision_changes() or None if the
+        message cannot change any decision.
+        """
         try:
             testcase = msg["testcase"]["name"]
         except KeyError:
@@ -81,16 +117,19 @@ class ResultsDBListener(BaseListener):
         except KeyError:
             submit_time = msg["result"]["submit_time"]
 
+        subject = self.announcement_subject(msg)
+        if subject is not None:
+            ResultsRetriever.invalidate_external_cache(subject, testcase, submit_time)
+
         outcome = msg.get("outcome")
         if outcome in self.app.config["OUTCOMES_INCOMPLETE"]:
             self.app.logger.debug("Assuming no decision change on outcome %r", outcome)
-            return False
+            return None
 
         brew_task_id = _get_brew_task_id(msg)
 
-        subject = self.announcement_subject(msg)
         if subject is None:
-            return False
+            return None
 
         self.app.logger.debug("Considering subject: %r", subject)
 
@@ -102,11 +141,90 @@ class ResultsDBListener(BaseListener):
 
         self.app.logger.debug("Guessed product version: %r", product_version)
 
-        self._publish_decision_change(
+        return dict(
             submit_time=submit_time,
             subject=subject,
-            testcase=testcase,
+            testcases=[testcase],
             product_version=product_version,
-            publish_testcase=False,
         )
+
+    def _consume_message(self, msg):
+        change = self._decision_change(msg)
+        if change is None:
+            return False
+
+        ResultsRetriever.refresh_external_cache(change["subject"], change["testcases"])
+        self._publish_decision_changes(**change)
         return True
+
+    def _process_message(self, headers, data):
+        if self.coalescer is None:
+            super()._process_message(headers, data)
+            return
+
+        try:
+            with self.app.app_context():
+                change = self._decision_change(data)
+        except BaseException:
+            self._inc(messaging_rx_failed_counter)
+            _send_nack(self, headers)
+            raise
+
+        if change is None:
+            _send_ack(self, headers)
+            self._inc(messaging_rx_ignored_counter)
+            return
+
+        subject = change["subject"]
+        key = (subject.type, subject.identifier, change["product_version"])
+        self.coalescer.add(key, (headers, change))
+
+    def _submit_coalesced(self, key, items):
+        _, subject_identifier, _ = key
+        self.flush_pool.submit(
+            subject_identifier, self._publish_coalesced_decision_changes, key, items
+        )
+
+    def _finish_pending_messages(self):
+        if self.coalescer is None or not self.connection.is_connected():
+            return
+
+        self.app.logger.debug("Processing coalesced messages")
+        if self.worker_pool is not None:
+            self.worker_pool.join()
+        self.coalescer.flush_all()
+        self.flush_pool.join()
+
+    def _publish_coalesced_decision_changes(self, _key, items):
+        """
+        Publishes decision changes once for messages with the same subject
+        and product version, comparing decisions before the earliest result
+        with the latest ones.
+        """
+        changes = [change for _, change in items]
+        self.app.logger.debug("Coalesced %d messages", len(changes))
+        submit_time = min(
+            (change["submit_time"] for change in changes), key=right_before_this_time
+        )
+        testcases = sorted(
+            {testcase for change in changes for testcase in change["testcases"]}
+        )
+
+        try:
+            with self.app.app_context():
+                ResultsRetriever.refresh_external_cache(changes[0]["subject"], testcases)
+                self._publish_decision_changes(
+                    submit_time=submit_time,
+                    subject=changes[0]["subject"],
+                    testcases=testcases,
+                    product_version=changes[0]["product_version"],
+                )
+        except BaseException:
+            for headers, _ in items:
+                self._inc(messaging_rx_failed_counter)
+                _send_nack(self, headers)
+            raise
+
+        for headers, _ in items:
+            _send_ack(self, headers)
+            self._inc(messaging_rx_processed_ok_counter)
@@ -11,6 +11,9 @@ class WaiverDBListener(BaseListener):
         self.topic = self.app.config["LISTENER_WAIVERDB_QUEUE"]
         self.koji_base_url = self.app.config["KOJI_BASE_URL"]
 
+    def _ordering_key(self, message):
+        return message.get("subject_identifier")
+
     def _consume_message(self, msg):
         product_version = msg["product_version"]
         testcase = msg["testcase"]
@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: GPL-2.0+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+
+class OrderedWorkerPool:
+    """
+    Runs tasks in worker threads.
+
+    Tasks submitted with the same key run one at a time in the order they
+    were submitted. Submitting a task blocks while there are too many
+    pending tasks.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="listener-worker"
+        )
+        self.pending_semaphore = threading.BoundedSemaphore(max_pending)
+        self.condition = threading.Condition()
+        # Maps key to queue with pending tasks.
+        self.queues = {}
+        self.pending_count = 0
+
+    def submit(self, key, fn, *args):
+        """
+        Schedules fn(*args) to be called after all previously submitted tasks
+        with the same key finish. None key does not need any ordering.
+        """
+        if key is None:
+            key = object()
+
+        self.pending_semaphore.acquire()
+        with self.condition:
+            self.pending_count += 1
+            queue = self.queues.get(key)
+            if queue is not None:
+                queue.append((fn, args))
+                return
+
+            self.queues[key] = deque([(fn, args)])
+
+        self.executor.submit(self._run, key)
+
+    def _run(self, key):
+        while True:
+            with self.condition:
+                queue = self.queues[key]
+                if not queue:
+                    del self.queues[key]
+                    return
+                fn, args = queue.popleft()
+
+            try:
+                fn(*args)
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Unexpected exception in listener worker")
+            finally:
+                self.pending_semaphore.release()
+                with self.condition:
+                    self.pending_count -= 1
+                    self.condition.notify_all()
+
+    def join(self):
+        """Waits until all submitted tasks finish."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending_count == 0)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class Coalescer:
+    """
+    Groups items added with the same key within a time window (in seconds)
+    after the first one and calls flush(key, items) once for each group.
+
+    Groups are flushed in order from a single thread, so flush() should only
+    hand the items over, for example to OrderedWorkerPool.
+    """
+
+    def __init__(self, window, flush):
+        self.window = window
+        self.flush = flush
+        self.condition = threading.Condition()
+        # Maps key to pair of flush time and list of items, ordered by the
+        # flush time.
+        self.groups = {}
+        self.thread = None
+
+    def add(self, key, item):
+        with self.condition:
+            group = self.groups.get(key)
+            if group is not None:
+                group[1].append(item)
+                return
+
+            self.groups[key] = (time.monotonic() + self.window, [item])
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name="listener-coalescer", daemon=True
+                )
+                self.thread.start()
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                key, items = self._wait_for_group()
+            self._flush(key, items)
+
+    def _wait_for_group(self):
+        while True:
+            timeout = None
+            if self.groups:
+                key, (flush_time, items) = next(iter(self.groups.items()))
+                timeout = flush_time - time.monotonic()
+                if timeout <= 0:
+                    del self.groups[key]
+                    return key, items
+            self.condition.wait(timeout)
+
+    def _flush(self, key, items):
+        try:
+            self.flush(key, items)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Unexpected exception while flushing coalesced items")
+
+    def flush_all(self):
+        """Flushes all groups immediately."""
+        with self.condition:
+            groups = list(self.groups.items())
+            self.groups.clear()
+
+        for key, (_, items) in groups:
+            self._flush(key, items)
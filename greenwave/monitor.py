@@ -36,6 +36,11 @@ class Stat:
         )
         return f'{self.name}[{labels}]'
 
+    def labels(self, **labeldict):
+        new_labeldict = dict(self.labeldict)
+        new_labeldict.update(labeldict)
+        return type(self)(self.name, labeldict=new_labeldict)
+
 
 class Counter(Stat):
     def inc(self):
@@ -43,11 +48,6 @@ class Counter(Stat):
         if client:
             client.incr(str(self))
 
-    def labels(self, **labeldict):
-        new_labeldict = dict(self.labeldict)
-        new_labeldict.update(labeldict)
-        return Counter(self.name, labeldict=new_labeldict)
-
     def count_exceptions(self):
         """Returns function decorator to increase counter on exception."""
         def decorator(fn):
@@ -62,6 +62,13 @@ class Counter(Stat):
         return decorator
 
 
+class Gauge(Stat):
+    def set(self, value):
+        client = stats_client()
+        if client:
+            client.gauge(str(self), value)
+
+
 class Histogram(Stat):
     def time(self):
         """Returns function decorator to that sends recorder call time."""
@@ -101,3 +108,23 @@ decision_changed_counter = Counter('decision_changed')
 decision_unchanged_counter = Counter('decision_unchanged')
 # Failed to retrieve decision for a new result/waiver
 decision_failed_counter = Counter('decision_failed')
+# Parsed remote rule file found in in-process cache
+remote_policies_cache_hit_counter = Counter('remote_policies_cache_hit')
+# Parsed remote rule file not found in in-process cache
+remote_policies_cache_miss_counter = Counter('remote_policies_cache_miss')
+# Connections from pool to an upstream service currently in use
+http_pool_connections_in_use_gauge = Gauge('http_pool_connections_in_use')
+# Connection to an upstream service created when all connections in the
+# pool were in use (it is discarded after use)
+http_pool_overflow_counter = Counter('http_pool_overflow')
+# Request to ResultsDB sent again because the first one was too slow
+resultsdb_hedged_request_counter = Counter('resultsdb_hedged_requests')
+# State of circuit breaker for an upstream service (0 - closed, 1 - half-open,
+# 2 - open)
+circuit_breaker_state_gauge = Gauge('circuit_breaker_state')
+# Request to an upstream service failed immediately because circuit is open
+circuit_breaker_rejected_counter = Counter('circuit_breaker_rejected')
+# Value of a cached function found in a cache tier ("local" or "shared")
+cache_hit_counter = Counter('cache_hit')
+# Value of a cached function not found in a cache tier ("local" or "shared")
+cache_miss_counter = Counter('cache_miss')
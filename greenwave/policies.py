@@ -1,7 +1,8 @@
 # SPDX-License-Identifier: GPL-2.0+
 
-from fnmatch import fnmatch
+from fnmatch import translate
 import glob
+import hashlib
 import logging
 import os
 import re
@@ -26,7 +27,7 @@ def load_policies(policies_dir):
     Load Greenwave policies from the given policies directory.
 
     :param str policies_dir: A path points to the policies directory.
-    :return: A list of policies.
+    :return: A list of policies (PolicyIndex).
 
     """
     policy_pathnames = glob.glob(os.path.join(policies_dir, '*.yaml'))
@@ -35,7 +36,7 @@ def load_policies(policies_dir):
         with open(policy_pathname, 'r') as f:
             policies.extend(greenwave.policies.Policy.safe_load_all(f))
     log.debug("Loaded %i policies from %s", len(policies), policies_dir)
-    return policies
+    return PolicyIndex(policies)
 
 
 def _remote_urls(subject):
@@ -86,6 +87,35 @@ def _remote_urls(subject):
         yield current_url.format(**url_params)
 
 
+def _load_remote_policies(url, content):
+    """
+    Returns policies parsed from remote rule file content and parsing error
+    message or None.
+
+    Parsed policies are kept in in-process cache by URL and content digest.
+    """
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    key = (url, hashlib.sha256(data).hexdigest())
+    cache = current_app.remote_policies_cache
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    try:
+        policies = RemotePolicy.safe_load_all(content)
+        error = None
+    except SafeYAMLError as e:
+        policies = []
+        error = str(e)
+
+    for policy in policies:
+        policy.source = url
+
+    value = (policies, error)
+    cache.set(key, value)
+    return value
+
+
 class DisallowedRuleError(RuntimeError):
     pass
 
@@ -530,6 +560,9 @@ class Rule(SafeYAMLObject):
 
     This base class is not used directly.
     """
+    # Evaluating the rule requires Koji build information.
+    requires_koji_build = False
+
     def check(self, policy, rule_context):
         """
         Evaluate this policy rule for the given item.
@@ -543,6 +576,20 @@ class Rule(SafeYAMLObject):
         """
         raise NotImplementedError()
 
+    def test_case_names(self, policy, rule_context):
+        #pylint: disable=unused-argument
+        """
+        Returns names of test cases with results required to evaluate the rule.
+
+        Args:
+            policy (Policy): Parent policy of the rule
+            rule_context (RuleContext): rule context
+
+        Returns:
+            list: Test case names
+        """
+        return []
+
     def matches(self, policy, **attributes):
         #pylint: disable=unused-argument
         """
@@ -570,6 +617,8 @@ class RemoteRule(Rule):
         'required': SafeYAMLBool(optional=True, default=False),
     }
 
+    requires_koji_build = True
+
     def _get_sub_policies(self, policy, subject):
         #pylint: disable=broad-except
         """
@@ -611,16 +660,11 @@ class RemoteRule(Rule):
 
         answers.append(FetchedRemoteRuleYaml(subject, remote_policies_url))
 
-        try:
-            policies = RemotePolicy.safe_load_all(response)
-        except SafeYAMLError as e:
+        policies, error = _load_remote_policies(remote_policies_url, response)
+        if error is not None:
             answers.append(
                 InvalidRemoteRuleYaml(
-                    subject, 'invalid-gating-yaml', str(e), remote_policies_url))
-            policies = []
-
-        for sub_policy in policies:
-            sub_policy.source = remote_policies_url
+                    subject, 'invalid-gating-yaml', error, remote_policies_url))
 
         sub_policies = [
             sub_policy for sub_policy in policies
@@ -628,8 +672,20 @@ class RemoteRule(Rule):
         ]
         return sub_policies, answers
 
+    def _get_rule_context_sub_policies(self, policy, rule_context):
+        """
+        Same as _get_sub_policies() but retrieves the remote rule file only
+        once for the rule context.
+        """
+        key = (policy, self)
+        sub_policies = rule_context.remote_sub_policies.get(key)
+        if sub_policies is None:
+            sub_policies = self._get_sub_policies(policy, rule_context.subject)
+            rule_context.remote_sub_policies[key] = sub_policies
+        return sub_policies
+
     def check(self, policy, rule_context):
-        policies, answers = self._get_sub_policies(policy, rule_context.subject)
+        policies, answers = self._get_rule_context_sub_policies(policy, rule_context)
 
         # Copy cached value.
         answers = list(answers)
@@ -645,6 +701,15 @@ class RemoteRule(Rule):
 
         return answers
 
+    def test_case_names(self, policy, rule_context):
+        policies, _ = self._get_rule_context_sub_policies(policy, rule_context)
+        return [
+            test_case_name
+            for remote_policy in policies
+            if remote_policy.matches_product_version(rule_context.product_version)
+            for test_case_name in remote_policy.test_case_names(rule_context)
+        ]
+
     def matches(self, policy, **attributes):
         subject = attributes.get('subject')
         if not subject:
@@ -684,11 +749,15 @@ class PassingTestCaseRule(Rule):
         'valid_until': SafeYAMLDateTime(optional=True),
     }
 
+    @property
+    def requires_koji_build(self):
+        return bool(self.valid_since or self.valid_until)
+
     def check(self, policy, rule_context):
-        if self.valid_since or self.valid_until:
+        if self.requires_koji_build:
             koji_url = current_app.config["KOJI_BASE_URL"]
             subject_creation_time = greenwave.resources.retrieve_koji_build_creation_time(
-                rule_context.subject, koji_url)
+                rule_context.subject.identifier, koji_url)
             if self.valid_since and subject_creation_time < self.valid_since:
                 return []
             if self.valid_until and self.valid_until <= subject_creation_time:
@@ -716,6 +785,9 @@ class PassingTestCaseRule(Rule):
             for result in matching_results
         ]
 
+    def test_case_names(self, policy, rule_context):
+        return [self.test_case_name]
+
     def matches(self, policy, **attributes):
         testcase = attributes.get('testcase')
         return not testcase or testcase == self.test_case_name
@@ -789,6 +861,16 @@ class FedoraAtomicCi(PackageSpecificBuild):
     yaml_tag = '!FedoraAtomicCi'
 
 
+def _compile_patterns(patterns):
+    """
+    Returns single regular expression matching any of the glob patterns.
+    """
+    if not patterns:
+        # Never matches.
+        return re.compile('(?!)')
+    return re.compile('|'.join(translate(pattern) for pattern in patterns))
+
+
 class Policy(SafeYAMLObject):
     root_yaml_tag = '!Policy'
 
@@ -806,6 +888,7 @@ class Policy(SafeYAMLObject):
     }
 
     source = None
+    _regexes = None
 
     def validate(self):
         if not self.decision_context and not self.decision_contexts:
@@ -815,6 +898,19 @@ class Policy(SafeYAMLObject):
                 'Both properties "decision_contexts" and "decision_context" were set'
             )
         super().validate()
+        self._compile_patterns()
+
+    def _compile_patterns(self):
+        self._regexes = {
+            attribute_name: _compile_patterns(getattr(self, attribute_name))
+            for attribute_name in ('product_versions', 'packages', 'excluded_packages')
+        }
+
+    def _matches_patterns(self, attribute_name, value):
+        # Policies not created from YAML are not validated.
+        if self._regexes is None:
+            self._compile_patterns()
+        return self._regexes[attribute_name].match(value) is not None
 
     def matches(self, **attributes):
         """
@@ -837,6 +933,9 @@ class Policy(SafeYAMLObject):
         if not self.matches_subject_type(**attributes):
             return False
 
+        return self.matches_rules(**attributes)
+
+    def matches_rules(self, **attributes):
         return not self.rules or any(rule.matches(self, **attributes) for rule in self.rules)
 
     def matches_subject_type(self, **attributes):
@@ -849,10 +948,9 @@ class Policy(SafeYAMLObject):
     def check(self, rule_context):
         name = rule_context.subject.package_name
         if name:
-            for exclude in self.excluded_packages:
-                if fnmatch(name, exclude):
-                    return [ExcludedInPolicy(rule_context.subject.identifier, self)]
-            if self.packages and not any(fnmatch(name, package) for package in self.packages):
+            if self.excludes_package(name):
+                return [ExcludedInPolicy(rule_context.subject.identifier, self)]
+            if not self.matches_package(name):
                 # If the `packages` allowlist is set and this package isn't in the
                 # `packages` allowlist, then the policy doesn't apply to it
                 return []
@@ -863,7 +961,34 @@ class Policy(SafeYAMLObject):
         return answers
 
     def matches_product_version(self, product_version):
-        return any(fnmatch(product_version, version) for version in self.product_versions)
+        return self._matches_patterns('product_versions', product_version)
+
+    def excludes_package(self, name):
+        return self._matches_patterns('excluded_packages', name)
+
+    def matches_package(self, name):
+        """
+        Returns True only if the package is not excluded and either there is
+        no `packages` allowlist or the package is in it.
+        """
+        if self.excludes_package(name):
+            return False
+        return not self.packages or self._matches_patterns('packages', name)
+
+    @property
+    def requires_koji_build(self):
+        return any(rule.requires_koji_build for rule in self.rules)
+
+    def test_case_names(self, rule_context):
+        """
+        Returns names of test cases with results required to evaluate the
+        policy rules.
+        """
+        return [
+            test_case_name
+            for rule in self.rules
+            for test_case_name in rule.test_case_names(self, rule_context)
+        ]
 
     @property
     def safe_yaml_label(self):
@@ -924,10 +1049,104 @@ class RemotePolicy(Policy):
         super().validate()
 
 
+class PolicyIndex(list):
+    """
+    List of policies indexed by decision context, subject type and product
+    version for fast lookup of matching policies.
+
+    Product versions without wildcards are looked up in a dict, patterns are
+    compiled to regular expressions only once.
+
+    The list must not be modified after it is created.
+    """
+
+    def __init__(self, policies=()):
+        super().__init__(policies)
+
+        # Maps decision context to subject type to a pair of dict (mapping
+        # product version to list of policy positions) and list of compiled
+        # product version patterns and policy positions.
+        self.index = {}
+
+        patterns = {}
+        for position, policy in enumerate(self):
+            for decision_context in policy.all_decision_contexts:
+                exact, wildcards = self.index.setdefault(decision_context, {}).setdefault(
+                    policy.subject_type, ({}, []))
+                for product_version in policy.product_versions:
+                    if _is_pattern(product_version):
+                        regex = patterns.get(product_version)
+                        if regex is None:
+                            regex = re.compile(translate(product_version))
+                            patterns[product_version] = regex
+                        wildcards.append((regex, position))
+                    else:
+                        exact.setdefault(product_version, []).append(position)
+
+    def candidates(self, **attributes):
+        """
+        Returns policies matching decision context, product version and
+        subject type attributes, in the original order.
+
+        Same as Policy.matches() except that the rules are not checked.
+        """
+        decision_context = attributes.get('decision_context')
+        if decision_context:
+            subject_type_indexes = [self.index.get(decision_context, {})]
+        else:
+            subject_type_indexes = self.index.values()
+
+        subject = attributes.get('subject')
+        product_version = attributes.get('product_version')
+
+        positions = set()
+        for subject_type_index in subject_type_indexes:
+            if subject:
+                product_version_indexes = [subject_type_index.get(subject.type, ({}, []))]
+            else:
+                product_version_indexes = subject_type_index.values()
+
+            for exact, wildcards in product_version_indexes:
+                if product_version:
+                    positions.update(exact.get(product_version, ()))
+                    positions.update(
+                        position for regex, position in wildcards
+                        if regex.match(product_version)
+                    )
+                else:
+                    for exact_positions in exact.values():
+                        positions.update(exact_positions)
+                    positions.update(position for _, position in wildcards)
+
+        return [self[position] for position in sorted(positions)]
+
+    def matching(self, **attributes):
+        """
+        Returns policies matching the attributes (see Policy.matches()).
+        """
+        return [
+            policy for policy in self.candidates(**attributes)
+            if policy.matches_rules(**attributes)
+        ]
+
+
+def _is_pattern(product_version):
+    return any(c in product_version for c in '*?[')
+
+
+def matching_policies(policies, **attributes):
+    """
+    Returns policies matching the attributes (see Policy.matches()).
+
+    Uses the index if policies is PolicyIndex, otherwise checks each policy.
+    """
+    if isinstance(policies, PolicyIndex):
+        return policies.matching(**attributes)
+    return [policy for policy in policies if policy.matches(**attributes)]
+
+
 def _applicable_decision_context_product_version_pairs(policies, **attributes):
-    applicable_policies = [
-        policy for policy in policies if policy.matches(**attributes)
-    ]
+    applicable_policies = matching_policies(policies, **attributes)
 
     log.debug("found %i applicable policies of %i for: %r",
               len(applicable_policies), len(policies), attributes)
@@ -1,16 +1,24 @@
 import logging
+import threading
+import time
 
 import requests
 
 from json import dumps
-from requests.adapters import HTTPAdapter
+from requests.adapters import DEFAULT_POOLBLOCK, DEFAULT_POOLSIZE, HTTPAdapter
 from requests.exceptions import ConnectionError, ConnectTimeout, RetryError
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from urllib3.util.retry import Retry
-from urllib3.exceptions import ProxyError, SSLError
+from urllib3.exceptions import MaxRetryError, ProxyError, ResponseError, SSLError
 
-from flask import current_app, has_app_context
+from flask import current_app, g, has_app_context
 
 from greenwave import __version__
+from greenwave.circuit_breaker import circuit_breaker
+from greenwave.monitor import (
+    http_pool_connections_in_use_gauge,
+    http_pool_overflow_counter,
+)
 
 log = logging.getLogger(__name__)
 
@@ -28,33 +36,209 @@ class ErrorResponse(requests.Response):
         return dumps({'message': self._error_message}).encode()
 
 
+# Deadline of the request currently made by the thread (see DeadlineRetry).
+_request_deadline = threading.local()
+
+
+def start_deadline(seconds):
+    """
+    Sets deadline for all requests made in the current app context, or
+    removes it if seconds is None.
+    """
+    set_deadline(None if seconds is None else time.monotonic() + seconds)
+
+
+def set_deadline(deadline):
+    """
+    Sets deadline (time.monotonic() value) for all requests made in the
+    current app context.
+    """
+    g.requests_deadline = deadline
+
+
+def get_deadline():
+    """
+    Returns deadline for requests made in the current app context or None.
+    """
+    if not has_app_context():
+        return None
+    return g.get('requests_deadline')
+
+
+def _shrink_timeout(timeout, remaining):
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    return min(timeout, remaining)
+
+
+class DeadlineRetry(Retry):
+    """
+    Retry which gives up if the next attempt could not start before the
+    deadline of the request.
+    """
+    def increment(self, method=None, url=None, response=None, error=None,
+                  _pool=None, _stacktrace=None):
+        retry = super().increment(
+            method, url, response=response, error=error, _pool=_pool, _stacktrace=_stacktrace)
+        deadline = getattr(_request_deadline, 'deadline', None)
+        if deadline is not None and time.monotonic() + retry.get_backoff_time() >= deadline:
+            reason = error or ResponseError('deadline exceeded before next retry')
+            raise MaxRetryError(_pool, url, reason) from reason
+        return retry
+
+
 class RequestsSession(requests.Session):
+    # Name of the upstream service for circuit breaker (see
+    # greenwave.circuit_breaker)
+    upstream = None
+
     def request(self, *args, **kwargs):  # pylint:disable=arguments-differ
         log.debug('Request: args=%r, kwargs=%r', args, kwargs)
 
         req_url = kwargs.get('url', args[1])
 
         kwargs.setdefault('headers', {'Content-Type': 'application/json'})
+        deadline = None
+        breaker = None
+        token = None
         if has_app_context():
-            kwargs.setdefault('timeout', current_app.config['REQUESTS_TIMEOUT'])
+            timeout = current_app.config['REQUESTS_TIMEOUT']
+            deadline = get_deadline()
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    log.debug('Deadline exceeded for request: %s', req_url)
+                    return ErrorResponse(
+                        504, 'Deadline for upstream requests exceeded', req_url)
+                timeout = _shrink_timeout(timeout, remaining)
+            kwargs.setdefault('timeout', timeout)
             kwargs.setdefault('verify', current_app.config['REQUESTS_VERIFY'])
 
+            if self.upstream is not None:
+                breaker = circuit_breaker(self.upstream)
+            if breaker is not None:
+                token = breaker.allow_request()
+                if token is None:
+                    log.debug('Circuit breaker open for request: %s', req_url)
+                    return ErrorResponse(
+                        503, f'Circuit breaker for {self.upstream} is open', req_url)
+
+        _request_deadline.deadline = deadline
+        ret_val = None
         try:
             ret_val = super().request(*args, **kwargs)
         except (ConnectTimeout, RetryError) as e:
             ret_val = ErrorResponse(504, str(e), req_url)
         except (ConnectionError, ProxyError, SSLError) as e:
             ret_val = ErrorResponse(502, str(e), req_url)
+        finally:
+            _request_deadline.deadline = None
+            if breaker is not None:
+                breaker.record(token, failed=ret_val is None or ret_val.status_code >= 500)
 
         log.debug('Request finished: %r', ret_val)
         return ret_val
 
 
-def get_requests_session():
-    """ Get http(s) session for request processing.  """
+class _ConnectionCounter:
+    """
+    Thread-safe number of connections in use.
+    """
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def add(self, change):
+        with self.lock:
+            self.value += change
+            return self.value
+
+
+class PoolMetricsMixin:
+    """
+    Connection pool mixin reporting number of connections in use and
+    connections created over the pool size.
+
+    The number of connections in use is reported for all pools of the
+    upstream service together (upstream_connections_in_use is shared by the
+    pools), the overflow is checked for each pool.
+    """
+    upstream = None
+    upstream_connections_in_use = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections_in_use = _ConnectionCounter()
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        self._update_connections_in_use(1)
+        return conn
+
+    def _put_conn(self, conn):
+        self._update_connections_in_use(-1)
+        super()._put_conn(conn)
+
+    def _update_connections_in_use(self, change):
+        connections_in_use = self.connections_in_use.add(change)
+        upstream_connections_in_use = self.upstream_connections_in_use.add(change)
+
+        labels = {'upstream': self.upstream}
+        http_pool_connections_in_use_gauge.labels(**labels).set(upstream_connections_in_use)
+        pool = self.pool
+        if change > 0 and pool is not None and connections_in_use > pool.maxsize:
+            http_pool_overflow_counter.labels(**labels).inc()
+
+
+class UpstreamHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter with connection pools reporting metrics for an upstream
+    service.
+    """
+    def __init__(self, upstream, **kwargs):
+        self.upstream = upstream
+        self.connections_in_use = _ConnectionCounter()
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):  # pylint:disable=arguments-differ
+        super().init_poolmanager(*args, **kwargs)
+        attributes = {
+            'upstream': self.upstream,
+            'upstream_connections_in_use': self.connections_in_use,
+        }
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(pool_class.__name__, (PoolMetricsMixin, pool_class), attributes)
+            for scheme, pool_class in (
+                ('http', HTTPConnectionPool),
+                ('https', HTTPSConnectionPool),
+            )
+        }
+
+
+def get_requests_session(
+        upstream='default',
+        pool_connections=DEFAULT_POOLSIZE,
+        pool_maxsize=DEFAULT_POOLSIZE,
+        pool_block=DEFAULT_POOLBLOCK):
+    """
+    Get http(s) session for request processing.
+
+    Args:
+        upstream (str): Name of the upstream service for metrics and circuit
+            breaker
+        pool_connections (int): Number of hosts to keep connection pools for
+        pool_maxsize (int): Maximum number of connections kept in pool for
+            each host
+        pool_block (bool): Wait for a free connection if all connections in
+            pool are used, instead of opening a new one and discarding it
+            after use
+    """
 
     session = RequestsSession()
-    retry = Retry(
+    session.upstream = upstream
+    retry = DeadlineRetry(
         total=3,
         read=3,
         connect=3,
@@ -62,7 +246,13 @@ def get_requests_session():
         status_forcelist=(500, 502, 503, 504),
         allowed_methods=Retry.DEFAULT_ALLOWED_METHODS.union(('POST',)),
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = UpstreamHTTPAdapter(
+        upstream,
+        max_retries=retry,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+    )
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     session.headers["User-Agent"] = f"greenwave {__version__}"
@@ -6,39 +6,147 @@ waiverdb, etc..).
 
 """
 
+import collections
+import copy
 import datetime
+import json
 import logging
+import math
 import re
 import socket
 import threading
-
+import time
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    TimeoutError as FuturesTimeoutError,
+    wait as futures_wait,
+)
 from dateutil import tz
 from dateutil.parser import parse
 from urllib.parse import urlparse
 import xmlrpc.client
-from flask import current_app
+from dogpile.cache.api import NO_VALUE
+from flask import current_app, g
 from werkzeug.exceptions import BadGateway, NotFound
 
-from greenwave.cache import cached
-from greenwave.request_session import get_requests_session
+from greenwave.cache import (
+    cached,
+    cached_value,
+    negative_cached,
+    negative_cached_value,
+)
+from greenwave.circuit_breaker import circuit_breaker
+from greenwave.monitor import resultsdb_hedged_request_counter
+from greenwave.request_session import get_deadline, get_requests_session, set_deadline
+from greenwave.utils import add_to_timestamp
+from greenwave.waivers import filter_waivers
 from greenwave.xmlrpc_server_proxy import get_server_proxy
 
 log = logging.getLogger(__name__)
 
-requests_session = threading.local().requests_session = get_requests_session()
+# Maps upstream service name and connection pool options to HTTP session
+# shared by all threads (see upstream_session()).
+_upstream_sessions = {}
+_upstream_sessions_lock = threading.Lock()
+
+
+def upstream_session(upstream):
+    """
+    Returns HTTP session for an upstream service ("resultsdb", "waiverdb" or
+    "dist_git") with connection pool configured by REQUESTS_POOL and
+    REQUESTS_UPSTREAM_POOLS options.
+    """
+    pool_options = dict(current_app.config['REQUESTS_POOL'])
+    pool_options.update(current_app.config['REQUESTS_UPSTREAM_POOLS'].get(upstream, {}))
+    key = (upstream, tuple(sorted(pool_options.items())))
+
+    session = _upstream_sessions.get(key)
+    if session is None:
+        with _upstream_sessions_lock:
+            session = _upstream_sessions.get(key)
+            if session is None:
+                session = get_requests_session(upstream, **pool_options)
+                _upstream_sessions[key] = session
+    return session
+
+
+# Per-thread XMLRPC server proxy objects for Koji
+_koji_data = threading.local()
 
 
 def _koji(uri):
     """
     Returns per-thread cached XMLRPC server proxy object for Koji.
+
+    The proxy keeps the connection open so subsequent calls from the same
+    thread can reuse it.
     """
-    data = threading.local()
+    timeout = _requests_timeout()
     try:
-        return data.koji_server_proxy_cache
+        proxies = _koji_data.server_proxies
     except AttributeError:
-        proxy = get_server_proxy(uri, _requests_timeout())
-        data.koji_server_proxy_cache = proxy
-        return proxy
+        proxies = _koji_data.server_proxies = {}
+
+    breaker = circuit_breaker('koji')
+    key = (uri, timeout, breaker)
+    proxy = proxies.get(key)
+    if proxy is None:
+        proxy = get_server_proxy(uri, timeout, breaker)
+        proxies[key] = proxy
+    return proxy
+
+
+def _koji_calls():
+    """
+    Returns results of Koji XMLRPC calls made in current application context,
+    i.e. for a single decision request or message.
+    """
+    return g.setdefault('koji_calls', {})
+
+
+def _koji_call(koji_url, method, arg):
+    """
+    Calls Koji XMLRPC method with single argument.
+
+    The same call is made only once in the current application context and
+    calls already done with _koji_multicall() are not repeated.
+    """
+    calls = _koji_calls()
+    key = (koji_url, method, arg)
+    if key not in calls:
+        calls[key] = getattr(_koji(koji_url), method)(arg)
+
+    result = calls[key]
+    if isinstance(result, xmlrpc.client.Fault):
+        raise result
+    return result
+
+
+def _koji_multicall(koji_url, method, args):
+    """
+    Calls Koji XMLRPC method for each argument in a single "multiCall"
+    request.
+
+    Results are kept for subsequent _koji_call() calls in current application
+    context.
+    """
+    calls = _koji_calls()
+    args = [arg for arg in dict.fromkeys(args) if (koji_url, method, arg) not in calls]
+    if not args:
+        return
+
+    log.debug('Koji multicall %s for %r', method, args)
+    proxy = _koji(koji_url)
+    responses = proxy.multiCall([{'methodName': method, 'params': [arg]} for arg in args])
+    for arg, response in zip(args, responses):
+        # Successful call result is wrapped in a list, fault is a dict.
+        if isinstance(response, dict):
+            result = xmlrpc.client.Fault(response.get('faultCode'), response.get('faultString'))
+        else:
+            result = response[0]
+        calls[(koji_url, method, arg)] = result
 
 
 def _requests_timeout():
@@ -48,6 +156,100 @@ def _requests_timeout():
     return timeout
 
 
+def _with_app_context(fn):
+    """
+    Returns function calling the given one with a new context of the current
+    app and with the same deadline for requests, suitable to run in another
+    thread.
+    """
+    app = current_app._get_current_object()  # pylint: disable=protected-access
+    deadline = get_deadline()
+
+    def call(*args):
+        with app.app_context():
+            set_deadline(deadline)
+            return fn(*args)
+
+    return call
+
+
+def _map_concurrently(fn, items, max_workers):
+    """
+    Returns list with results of calling the function for each item using
+    at most given number of concurrent threads.
+
+    The order of the results is same as the order of the items.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(_with_app_context(fn), items))
+
+
+def _submit_in_background(fn, *args):
+    """
+    Returns future with result of calling the function in a new thread with
+    the current app.
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        return executor.submit(_with_app_context(fn), *args)
+    finally:
+        executor.shutdown(wait=False)
+
+
+class LatencyTracker:
+    """
+    Keeps latencies of recent requests.
+    """
+    def __init__(self, size=100):
+        self.latencies = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def percentile(self, percent, min_samples):
+        """
+        Returns latency for given percentile (can be fractional, e.g. 99.5)
+        using the nearest-rank method or None if there are not enough samples.
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies or len(latencies) < min_samples:
+            return None
+        rank = math.ceil(len(latencies) * percent / 100)
+        return latencies[min(len(latencies), max(1, rank)) - 1]
+
+
+# Latencies of successful requests to ResultsDB used for hedging.
+_resultsdb_latencies = LatencyTracker()
+
+
+def _hedged_request(request, hedge_after):
+    """
+    Returns result of the request function.
+
+    If the request does not finish within hedge_after seconds, the same
+    request is sent again and the result of the first finished one is
+    returned. This must be used only for idempotent requests.
+    """
+    first = _submit_in_background(request)
+    try:
+        return first.result(timeout=hedge_after)
+    except FuturesTimeoutError:
+        pass
+
+    log.debug('Hedging request after %.3f seconds', hedge_after)
+    resultsdb_hedged_request_counter.inc()
+    second = _submit_in_background(request)
+    done, _ = futures_wait((first, second), return_when=FIRST_COMPLETED)
+    return done.pop().result()
+
+
 class BaseRetriever:
     def __init__(self, ignore_ids, when, url):
         self.ignore_ids = ignore_ids
@@ -58,6 +260,25 @@ class BaseRetriever:
         else:
             self.since = None
 
+        # Retriever for latest data (without "when" parameter) which is used
+        # to avoid retrieving data again if nothing changed since "when".
+        self.latest = None
+
+    @property
+    def until(self):
+        if not self.since:
+            return None
+        return self.since.split(',')[1]
+
+    def with_ignore_ids(self, ignore_ids):
+        """
+        Returns retriever sharing retrieved data with this one but ignoring
+        different ids.
+        """
+        retriever = copy.copy(self)
+        retriever.ignore_ids = ignore_ids
+        return retriever
+
     def retrieve(self, *args, **kwargs):
         items = self._retrieve_all(*args, **kwargs)
         return [item for item in items if item['id'] not in self.ignore_ids]
@@ -77,61 +298,268 @@ class ResultsRetriever(BaseRetriever):
         super().__init__(**args)
         self._distinct_on = ','.join(
             current_app.config['DISTINCT_LATEST_RESULTS_ON'])
+        self.max_concurrent_requests = current_app.config['RESULTSDB_MAX_CONCURRENT_REQUESTS']
         self.cache = {}
+        self.testcase_cache = {}
+        # Maps (subject type, subject identifier) to pair of Subject and set of
+        # test cases to retrieve (or None to retrieve all results).
+        self.pending = {}
+
+    def prefetch(self, subject, testcases=None):
+        """
+        Marks results to be retrieved for given Subject, either for given test
+        cases or all results if testcases is None.
+
+        Results pending for all subjects are retrieved together, once any
+        uncached result is requested, using concurrent requests with a single
+        query per subject result query.
+        """
+        cache_key = (subject.type, subject.identifier)
+        if cache_key in self.cache:
+            return
+
+        if testcases is None:
+            self.pending[cache_key] = (subject, None)
+            return
+
+        _, pending = self.pending.setdefault(cache_key, (subject, set()))
+        if pending is not None:
+            pending.update(
+                testcase for testcase in testcases
+                if cache_key + (testcase,) not in self.testcase_cache
+            )
 
     def _retrieve_all(self, subject, testcase=None):
+        results = self._get_cached(subject, testcase)
+        if results is None:
+            self.prefetch(subject, [testcase] if testcase else None)
+            self._retrieve_pending()
+            results = self._get_cached(subject, testcase)
+        return results
+
+    def _get_cached(self, subject, testcase):
         # Get test case result from cache if all test case results were already
         # retrieved for given Subject.
         cache_key = (subject.type, subject.identifier)
-        if testcase and cache_key in self.cache:
-            return [res for res in self.cache[cache_key] if res['testcase']['name'] == testcase]
+        if cache_key in self.cache:
+            results = self.cache[cache_key]
+            if testcase:
+                return [res for res in results if res['testcase']['name'] == testcase]
+            return results
 
-        # Try to get passing test case result from external cache.
-        external_cache_key = None
         if testcase:
-            external_cache_key = (
-                "greenwave.resources:ResultsRetriever|"
-                f"{subject.type} {subject.identifier} {testcase}")
-            results = self.get_external_cache(external_cache_key)
-            if results and self._results_match_time(results):
-                return results
+            return self.testcase_cache.get(cache_key + (testcase,))
+
+        return None
 
+    def _retrieve_pending(self):
+        # Clear in place since pending retrievals can be shared with other
+        # retrievers (see with_ignore_ids()).
+        pending = dict(self.pending)
+        self.pending.clear()
+
+        retrievals = []
+        for subject, testcases in pending.values():
+            if testcases is None:
+                results = self._latest_results(subject, None)
+                if results is not None:
+                    self.cache[(subject.type, subject.identifier)] = results
+                    continue
+            else:
+                testcases = self._retrieve_from_latest(subject, sorted(testcases))
+                testcases = self._retrieve_from_external_cache(subject, testcases)
+                if not testcases:
+                    continue
+            queries = list(self._result_queries(subject, testcases))
+            retrievals.append((subject, testcases, queries))
+
+        data = iter(_map_concurrently(
+            self._retrieve_data,
+            [query for _, _, queries in retrievals for query in queries],
+            self.max_concurrent_requests,
+        ))
+        for subject, testcases, queries in retrievals:
+            results = [result for _ in queries for result in next(data)]
+            self._store(subject, testcases, results)
+
+    def _result_queries(self, subject, testcases):
         params = {
             '_distinct_on': self._distinct_on
         }
         if self.since:
             params.update({'since': self.since})
-        if testcase:
-            params.update({'testcases': testcase})
+        if testcases:
+            params.update({'testcases': ','.join(testcases)})
 
-        results = []
         for query in subject.result_queries():
             query.update(params)
-            results.extend(self._retrieve_data(query))
+            yield query
 
-        if not testcase:
-            self.cache[cache_key] = results
+    def _latest_results(self, subject, testcase):
+        """
+        Returns results already retrieved by the retriever for latest data if
+        none of these were submitted after "when", otherwise None.
+
+        Latest results are same as results before "when" if all of them were
+        submitted before "when".
+        """
+        if self.latest is None:
+            return None
 
-        # Store test case results in external cache if all are passing,
-        # otherwise retrieve from ResultsDB again later.
-        if external_cache_key and all(
-                result.get('outcome') in current_app.config['OUTCOMES_PASSED']
-                for result in results):
-            self.set_external_cache(external_cache_key, results)
+        results = self.latest._get_cached(subject, testcase)
+        if results is None or not self._results_match_time(results):
+            return None
 
         return results
 
+    def _retrieve_from_latest(self, subject, testcases):
+        """
+        Gets test case results from the retriever for latest data and returns
+        test cases to retrieve from ResultsDB.
+        """
+        missing_testcases = []
+        for testcase in testcases:
+            results = self._latest_results(subject, testcase)
+            if results is not None:
+                self.testcase_cache[(subject.type, subject.identifier, testcase)] = results
+            else:
+                missing_testcases.append(testcase)
+        return missing_testcases
+
+    def _retrieve_from_external_cache(self, subject, testcases):
+        """
+        Gets test case results from external cache and returns test cases to
+        retrieve from ResultsDB.
+        """
+        cache_all = current_app.config['CACHE_ALL_RESULTS']
+        refreshed_keys = g.get('refreshed_results_cache_keys', ())
+        missing_testcases = []
+        for testcase in testcases:
+            key = self._external_cache_key(subject, testcase)
+            if key in refreshed_keys:
+                missing_testcases.append(testcase)
+                continue
+
+            results = self.get_external_cache(key)
+            # Missing results are cached only if all results are cached.
+            cached = bool(results) or (cache_all and isinstance(results, list))
+            if cached and self._results_match_time(results):
+                self.testcase_cache[(subject.type, subject.identifier, testcase)] = results
+            else:
+                missing_testcases.append(testcase)
+        return missing_testcases
+
+    def _store(self, subject, testcases, results):
+        cache_key = (subject.type, subject.identifier)
+        if testcases is None:
+            self.cache[cache_key] = results
+            return
+
+        results_by_testcase = {testcase: [] for testcase in testcases}
+        for result in results:
+            testcase_results = results_by_testcase.get(result['testcase']['name'])
+            if testcase_results is not None:
+                testcase_results.append(result)
+
+        for testcase, testcase_results in results_by_testcase.items():
+            self.testcase_cache[cache_key + (testcase,)] = testcase_results
+
+            # Results before "when" are not the latest ones, which are read
+            # from the external cache.
+            if self.since:
+                continue
+
+            # Store test case results in external cache if all are passing,
+            # otherwise retrieve from ResultsDB again later (unless the cache
+            # is invalidated on new results).
+            if (current_app.config['CACHE_ALL_RESULTS'] or all(
+                    result.get('outcome') in current_app.config['OUTCOMES_PASSED']
+                    for result in testcase_results)) and \
+                    not self._older_than_watermark(subject, testcase, testcase_results):
+                self.set_external_cache(
+                    self._external_cache_key(subject, testcase), testcase_results)
+
+    def _older_than_watermark(self, subject, testcase, results):
+        """
+        Returns True if results were retrieved before the latest result
+        announced for the subject and test case was created, i.e. none of them
+        was submitted at or after the watermark.
+        """
+        watermark = self.get_external_cache(self._watermark_key(subject, testcase))
+        if watermark is NO_VALUE or watermark is None:
+            return False
+        return all(result['submit_time'] < watermark for result in results)
+
+    @staticmethod
+    def _external_cache_key(subject, testcase):
+        return (
+            "greenwave.resources:ResultsRetriever|"
+            f"{subject.type} {subject.identifier} {testcase}")
+
+    @staticmethod
+    def _watermark_key(subject, testcase):
+        return (
+            "greenwave.resources:ResultsRetriever.watermark|"
+            f"{subject.type} {subject.identifier} {testcase}")
+
+    @staticmethod
+    def invalidate_external_cache(subject, testcase, submit_time):
+        """
+        Removes cached results for the subject and test case from external
+        cache; called for each new result received from message bus.
+
+        Results retrieved before the new result was submitted are not stored
+        in external cache afterwards (see _older_than_watermark()).
+        """
+        cache = current_app.cache
+        watermark_key = ResultsRetriever._watermark_key(subject, testcase)
+        watermark = add_to_timestamp(submit_time)
+        old_watermark = cache.get(watermark_key)
+        if old_watermark is NO_VALUE or old_watermark < watermark:
+            cache.set(watermark_key, watermark)
+        cache.delete(ResultsRetriever._external_cache_key(subject, testcase))
+
+    @staticmethod
+    def refresh_external_cache(subject, testcases):
+        """
+        Makes retrievers in the current app context ignore externally cached
+        results for the subject and test cases and replace them with results
+        retrieved from ResultsDB; used when processing new results from
+        message bus.
+        """
+        refreshed_keys = g.setdefault('refreshed_results_cache_keys', set())
+        refreshed_keys.update(
+            ResultsRetriever._external_cache_key(subject, testcase) for testcase in testcases)
+
     def _make_request(self, params, **request_args):
-        return requests_session.get(
-            self.url + '/results/latest',
-            params=params,
-            **request_args)
+        def request():
+            start = time.monotonic()
+            response = upstream_session('resultsdb').get(
+                self.url + '/results/latest',
+                params=params,
+                **request_args)
+            if response.ok:
+                _resultsdb_latencies.add(time.monotonic() - start)
+            return response
+
+        hedge_after = self._hedge_after()
+        if hedge_after is None:
+            return request()
+        return _hedged_request(request, hedge_after)
+
+    @staticmethod
+    def _hedge_after():
+        percentile = current_app.config['RESULTSDB_HEDGE_PERCENTILE']
+        if percentile is None:
+            return None
+        return _resultsdb_latencies.percentile(
+            percentile, current_app.config['RESULTSDB_HEDGE_MIN_SAMPLES'])
 
     def _results_match_time(self, results):
-        if not self.since:
+        until = self.until
+        if not until:
             return True
 
-        until = self.since.split(',')[1]
         return all(result['submit_time'] < until for result in results)
 
     def get_external_cache(self, key):
@@ -141,20 +569,149 @@ class ResultsRetriever(BaseRetriever):
         current_app.cache.set(key, value)
 
 
+def _json_key(value):
+    return json.dumps(value, sort_keys=True)
+
+
 class WaiversRetriever(BaseRetriever):
     """
     Retrieves waivers from WaiverDB.
     """
 
+    def __init__(self, max_filters_per_request=0, max_concurrent_requests=1, **args):
+        super().__init__(**args)
+        self.max_filters_per_request = max_filters_per_request
+        self.max_concurrent_requests = max_concurrent_requests
+        # Maps filters to retrieved waivers.
+        self.cache = {}
+        # Maps single filter to retrieved waivers matching it (or any other
+        # filter requested together with it).
+        self.filter_cache = {}
+        # Filters to prefetch with start_prefetch().
+        self.pending = []
+        # Maps prefetched filter to future with retrieved waivers.
+        self.prefetched = {}
+
+    def prefetch(self, filters):
+        """
+        Marks waivers for the filters to be retrieved in background with
+        start_prefetch().
+        """
+        for filter_ in filters:
+            if filter_ not in self.pending and _json_key(filter_) not in self.prefetched:
+                self.pending.append(filter_)
+
+    def start_prefetch(self):
+        """
+        Starts retrieving waivers marked with prefetch() in background so
+        the request overlaps with retrieving results.
+
+        The prefetched waivers are used only if all filters passed later to
+        retrieve() were prefetched, otherwise waivers are requested as usual.
+        """
+        filters = list(self.pending)
+        self.pending.clear()
+
+        # Retriever for "when" can often reuse waivers retrieved for latest
+        # decision without any request.
+        if not filters or self.latest is not None:
+            return
+
+        future = _submit_in_background(self._retrieve_filtered, self._filters_since(filters))
+        for filter_ in filters:
+            self.prefetched[_json_key(filter_)] = future
+
     def _retrieve_all(self, filters):
-        if self.since:
-            for filter_ in filters:
-                filter_.update({'since': self.since})
-        waivers = self._retrieve_data(filters)
+        cache_key = _json_key(filters)
+        waivers = self.cache.get(cache_key)
+        if waivers is None:
+            waivers = self._latest_waivers(filters)
+
+        if waivers is None:
+            waivers = self._prefetched_waivers(filters)
+
+        if waivers is None:
+            waivers = self._retrieve_filtered(self._filters_since(filters))
+
+        self.cache[cache_key] = waivers
+        for filter_ in filters:
+            self.filter_cache[_json_key(filter_)] = waivers
         return [waiver for waiver in waivers if waiver['waived']]
 
+    def _filters_since(self, filters):
+        if self.since:
+            return [dict(filter_, since=self.since) for filter_ in filters]
+        return filters
+
+    def _prefetched_waivers(self, filters):
+        """
+        Returns prefetched waivers matching the filters, waiting for the
+        prefetch to finish if needed, or None if any filter was not
+        prefetched.
+        """
+        futures = []
+        for filter_ in filters:
+            future = self.prefetched.get(_json_key(filter_))
+            if future is None:
+                return None
+            if future not in futures:
+                futures.append(future)
+
+        waivers = {}
+        for future in futures:
+            for waiver in future.result():
+                waivers.setdefault(waiver['id'], waiver)
+        return filter_waivers(waivers.values(), filters)
+
+    def _retrieve_filtered(self, filters):
+        """
+        Retrieves waivers matching any of the filters.
+
+        Filters are split into batches of at most max_filters_per_request
+        filters which are requested concurrently. Waivers matching filters in
+        multiple batches are returned only once.
+        """
+        size = self.max_filters_per_request
+        if not size or len(filters) <= size:
+            return self._retrieve_data(filters)
+
+        batches = [filters[i:i + size] for i in range(0, len(filters), size)]
+        waivers = {}
+        for batch_waivers in _map_concurrently(
+                self._retrieve_data, batches, self.max_concurrent_requests):
+            for waiver in batch_waivers:
+                waivers.setdefault(waiver['id'], waiver)
+        return list(waivers.values())
+
+    def _latest_waivers(self, filters):
+        """
+        Returns waivers matching the filters already retrieved by the
+        retriever for latest data if none of these were created after "when",
+        otherwise None.
+
+        Each filter must have been requested by the latest retriever, but not
+        necessarily together with the same other filters.
+        """
+        if self.latest is None:
+            return None
+
+        waivers = {}
+        for filter_ in filters:
+            filter_waivers_ = self.latest.filter_cache.get(_json_key(filter_))
+            if filter_waivers_ is None:
+                return None
+            for waiver in filter_waivers_:
+                waivers.setdefault(waiver['id'], waiver)
+        waivers = filter_waivers(waivers.values(), filters)
+
+        until = self.until
+        if until and any(waiver.get('timestamp', until) >= until for waiver in waivers):
+            return None
+
+        return waivers
+
     def _make_request(self, params, **request_args):
-        return requests_session.post(
+        return upstream_session('waiverdb').post(
             self.url + '/waivers/+filtered',
             json={'filters': params},
             **request_args)
@@ -167,8 +724,7 @@ class NoSourceException(RuntimeError):
 @cached
 def retrieve_koji_build_target(nvr, koji_url):
     log.debug('Getting Koji task request ID %r', nvr)
-    proxy = _koji(koji_url)
-    task_request = proxy.getTaskRequest(nvr)
+    task_request = _koji_call(koji_url, 'getTaskRequest', nvr)
     if isinstance(task_request, list) and len(task_request) > 1:
         target = task_request[1]
         if isinstance(target, str):
@@ -176,11 +732,11 @@ def retrieve_koji_build_target(nvr, koji_url):
     return None
 
 
+@negative_cached(NotFound)
 @cached
 def _retrieve_koji_build_attributes(nvr, koji_url):
     log.debug('Getting Koji build %r', nvr)
-    proxy = _koji(koji_url)
-    build = proxy.getBuild(nvr)
+    build = _koji_call(koji_url, 'getBuild', nvr)
     if not build:
         raise NotFound(
             'Failed to find Koji build for "{}" at "{}"'.format(nvr, koji_url)
@@ -198,6 +754,27 @@ def _retrieve_koji_build_attributes(nvr, koji_url):
     return (task_id, source, creation_time)
 
 
+def prefetch_koji_builds(nvrs, koji_url):
+    """
+    Retrieves Koji builds, which are not cached yet, in a single request.
+    """
+    def is_cached(nvr):
+        return (
+            cached_value(_retrieve_koji_build_attributes, nvr, koji_url) is not NO_VALUE or
+            negative_cached_value(_retrieve_koji_build_attributes, nvr, koji_url) is not NO_VALUE
+        )
+
+    nvrs = [nvr for nvr in nvrs if not is_cached(nvr)]
+    if len(nvrs) < 2:
+        return
+
+    try:
+        _koji_multicall(koji_url, 'getBuild', nvrs)
+    except (xmlrpc.client.Error, socket.error) as err:
+        # Builds will be retrieved separately later.
+        log.warning('Failed to retrieve Koji builds: %s', err)
+
+
 def retrieve_koji_build_task_id(nvr, koji_url):
     return _retrieve_koji_build_attributes(nvr, koji_url)[0]
 
@@ -222,6 +799,7 @@ def retrieve_koji_build_creation_time(nvr, koji_url):
     return datetime.datetime.now(tz.tzutc())
 
 
+@negative_cached(NoSourceException)
 def retrieve_scm_from_koji(nvr):
     """Retrieve cached rev and namespace from koji using the nvr"""
     koji_url = current_app.config["KOJI_BASE_URL"]
@@ -259,18 +837,63 @@ def retrieve_scm_from_koji_build(nvr, source, koji_url):
     return namespace, pkg_name, rev
 
 
-@cached
+def _is_commit_pinned(url):
+    """
+    Returns true only if URL contains a full commit hash, i.e. the content at
+    the URL never changes.
+    """
+    return re.search(r'(?<![0-9a-f])[0-9a-f]{40}(?![0-9a-f])', url) is not None
+
+
 def retrieve_yaml_remote_rule(url):
-    """ Retrieve a remote rule file content from the git web UI. """
-    response = requests_session.request('HEAD', url)
-    if response.status_code == 404:
-        log.debug('Remote rule not found: %s', url)
+    """
+    Retrieve a remote rule file content from the git web UI.
+
+    Returns None if the file does not exist. This is cached in negative cache.
+
+    The content is cached. Content for URLs pinned to a commit is cached
+    without expiration, otherwise expired content is revalidated with
+    a conditional request.
+    """
+    cache = current_app.cache
+    # Versioned key: older releases cached raw content (or None) under the
+    # unversioned key of the function.
+    cache_key = f'greenwave.resources:retrieve_yaml_remote_rule:v2|{url}'
+
+    if current_app.negative_cache.get(cache_key) is not NO_VALUE:
+        log.debug('Remote rule not found (cached): %s', url)
         return None
 
-    if response.status_code != 200:
-        raise BadGateway('Error occurred while retrieving a remote rule file from the repo.')
+    remote_rule = cache.get(cache_key, ignore_expiration=_is_commit_pinned(url))
+    if remote_rule is not NO_VALUE:
+        return remote_rule['content']
+
+    request_args = {}
+    stale_remote_rule = cache.get(cache_key, ignore_expiration=True)
+    if stale_remote_rule is not NO_VALUE:
+        headers = {}
+        if stale_remote_rule.get('etag'):
+            headers['If-None-Match'] = stale_remote_rule['etag']
+        if stale_remote_rule.get('last_modified'):
+            headers['If-Modified-Since'] = stale_remote_rule['last_modified']
+        if headers:
+            request_args['headers'] = headers
+
+    response = upstream_session('dist_git').request('GET', url, **request_args)
+    if response.status_code == 304 and request_args:
+        log.debug('Remote rule not modified: %s', url)
+        remote_rule = stale_remote_rule
+    elif response.status_code == 404:
+        log.debug('Remote rule not found: %s', url)
+        current_app.negative_cache.set(cache_key, True)
+        return None
+    else:
+        response.raise_for_status()
+        remote_rule = {
+            'content': response.content,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
 
-    # remote rule file found...
-    response = requests_session.request('GET', url)
-    response.raise_for_status()
-    return response.content
+    cache.set(cache_key, remote_rule)
+    return remote_rule['content']
@@ -1,7 +1,11 @@
+import threading
+import time
+
 import mock
 import pytest
 
 from greenwave.app_factory import create_app
+from greenwave.utils import HANDLED_ERRORS
 
 
 @pytest.fixture(autouse=True)
@@ -21,8 +25,53 @@ def client(app):
     yield app.test_client()
 
 
+@pytest.fixture
+def mock_make_decision():
+    """
+    Mocks make_decision() which is also called for each decision request
+    made by the real make_subject_decisions().
+    """
+    def make_decisions(requests_data, config, on_error):
+        responses = []
+        for data in requests_data:
+            try:
+                responses.append((mocked(data, config), None))
+            except HANDLED_ERRORS as e:
+                responses.append(on_error(e))
+        return responses
+
+    with mock.patch('greenwave.decision.make_decision') as mocked, \
+            mock.patch('greenwave.decision._make_decisions', side_effect=make_decisions), \
+            mock.patch('greenwave.decision._decision_response',
+                       side_effect=lambda decision, rules: decision):
+        yield mocked
+
+
 @pytest.fixture
 def koji_proxy():
     mock_proxy = mock.Mock()
-    with mock.patch('greenwave.resources.get_server_proxy', return_value=mock_proxy):
+    with mock.patch('greenwave.resources.get_server_proxy', return_value=mock_proxy), \
+            mock.patch('greenwave.resources._koji_data', threading.local()):
         yield mock_proxy
+
+
+@pytest.fixture
+def compare_timings(record_property):
+    """
+    Returns function which calls baseline and optimized functions given
+    number of times and returns their average times in seconds (also recorded
+    as properties of the test).
+    """
+    def compare(baseline, optimized, count=1):
+        timings = []
+        for fn in (baseline, optimized):
+            start = time.perf_counter()
+            for _ in range(count):
+                fn()
+            timings.append((time.perf_counter() - start) / count)
+
+        baseline_time, optimized_time = timings
+        record_property('baseline_seconds', baseline_time)
+        record_property('optimized_seconds', optimized_time)
+        return baseline_time, optimized_time
+    return compare
@@ -1,12 +1,16 @@
 # SPDX-License-Identifier: GPL-2.0+
 
+import json
 import mock
+import threading
 import pytest
+import requests
 
 from textwrap import dedent
 
 from greenwave.app_factory import create_app
 from greenwave.policies import Policy
+from greenwave.request_session import ErrorResponse
 
 DEFAULT_DECISION_DATA = dict(
     decision_context='test_policies',
@@ -236,3 +240,204 @@ def test_subject_types(client):
         'redhat-container-image',
         'redhat-module',
     ]
+
+
+def make_decisions(decisions, policies=DEFAULT_DECISION_POLICIES):
+    app = create_app('greenwave.config.TestingConfig')
+    app.config['policies'] = Policy.safe_load_all(dedent(policies))
+    client = app.test_client()
+    return client.post('/api/v1.0/decisions', json={'decisions': decisions})
+
+
+def test_make_decisions_shares_results_and_waivers():
+    policies = """
+        --- !Policy
+        id: "test_policy"
+        product_versions:
+          - fedora-rawhide
+          - fedora-32
+        decision_context: test_policies
+        subject_type: koji_build
+        rules:
+          - !PassingTestCaseRule {test_case_name: sometest}
+    """
+    waiver = {
+        'id': 1,
+        'subject_type': DEFAULT_DECISION_DATA['subject_type'],
+        'subject_identifier': DEFAULT_DECISION_DATA['subject_identifier'],
+        'product_version': 'fedora-rawhide',
+        'testcase': 'sometest',
+        'waived': True,
+    }
+    decisions = [
+        DEFAULT_DECISION_DATA,
+        dict(DEFAULT_DECISION_DATA, product_version='fedora-32'),
+        dict(DEFAULT_DECISION_DATA, decision_context=None),
+    ]
+    with mock.patch('greenwave.resources.ResultsRetriever._retrieve_data') as results, \
+            mock.patch('greenwave.resources.WaiversRetriever._retrieve_data') as waivers:
+        results.side_effect = [[make_result(outcome='FAILED')], []]
+        waivers.return_value = [waiver]
+        response = make_decisions(decisions, policies)
+
+    assert response.status_code == 200
+    first, second, third = response.json['decisions']
+    assert first['status'] == 200
+    assert first['decision']['summary'] == 'All required tests passed'
+    assert second['status'] == 200
+    assert second['decision']['summary'] == '1 of 1 required tests failed'
+    assert third == {
+        'status': 400,
+        'message': 'Either decision_context or rules is required.',
+    }
+
+    # A single query per subject result query.
+    assert len(results.mock_calls) == 2
+    waivers.assert_called_once()
+    filters = waivers.call_args[0][0]
+    assert [f['product_version'] for f in filters] == ['fedora-rawhide', 'fedora-32']
+
+
+def test_make_decision_prefetches_waivers():
+    """
+    Test retrieving waivers for all required test cases while results are
+    being retrieved.
+    """
+    policies = """
+        --- !Policy
+        id: "test_policy"
+        product_versions:
+          - fedora-rawhide
+        decision_context: test_policies
+        subject_type: koji_build
+        rules:
+          - !PassingTestCaseRule {test_case_name: sometest}
+          - !PassingTestCaseRule {test_case_name: othertest}
+    """
+    waiver = {
+        'id': 1,
+        'subject_type': DEFAULT_DECISION_DATA['subject_type'],
+        'subject_identifier': DEFAULT_DECISION_DATA['subject_identifier'],
+        'product_version': 'fedora-rawhide',
+        'testcase': 'sometest',
+        'waived': True,
+    }
+    waivers_requested = threading.Event()
+    results_data = [[make_result(outcome='FAILED')], []]
+
+    def retrieve_results(_params):
+        # Results are returned only after waivers are requested.
+        assert waivers_requested.wait(timeout=5)
+        return results_data.pop(0)
+
+    def retrieve_waivers(_filters):
+        waivers_requested.set()
+        return [waiver]
+
+    app = create_app('greenwave.config.TestingConfig')
+    app.config['policies'] = Policy.safe_load_all(dedent(policies))
+    app.config['WAIVERDB_SPECULATIVE_PREFETCH'] = True
+    client = app.test_client()
+    with mock.patch('greenwave.resources.ResultsRetriever._retrieve_data') as results, \
+            mock.patch('greenwave.resources.WaiversRetriever._retrieve_data') as waivers:
+        results.side_effect = retrieve_results
+        waivers.side_effect = retrieve_waivers
+        response = client.post('/api/v1.0/decision', json=DEFAULT_DECISION_DATA)
+
+    assert response.status_code == 200
+    assert [
+        requirement['type'] for requirement in response.json['satisfied_requirements']
+    ] == ['test-result-failed-waived']
+    assert [
+        requirement['type'] for requirement in response.json['unsatisfied_requirements']
+    ] == ['test-result-missing']
+    waivers.assert_called_once()
+    filters = waivers.call_args[0][0]
+    assert [f['testcase'] for f in filters] == ['othertest', 'sometest']
+
+
+def test_make_decisions_invalid_data():
+    response = make_decisions({'decision_context': 'test_policies'})
+    assert response.status_code == 400
+    assert response.json['message'] == 'Invalid decisions, must be a non-empty list of dicts'
+
+
+def test_make_decisions_too_many(mock_results, mock_waivers):
+    response = make_decisions([DEFAULT_DECISION_DATA] * 101)
+    assert response.status_code == 400
+    assert response.json['message'] == 'Too many decisions requested, maximum is 100'
+
+
+def test_make_decision_ndjson(mock_results, mock_waivers):
+    mock_results.return_value = [make_result(outcome='PASSED')]
+    app = create_app('greenwave.config.TestingConfig')
+    app.config['policies'] = Policy.safe_load_all(dedent(DEFAULT_DECISION_POLICIES))
+    client = app.test_client()
+    response = client.post(
+        '/api/v1.0/decision', json=dict(DEFAULT_DECISION_DATA, verbose=True),
+        headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+    assert len(lines) == 3
+    assert lines[0] == {
+        'policies_satisfied': True,
+        'summary': 'All required tests passed',
+        'applicable_policies': ['test_policy'],
+    }
+    assert lines[1]['satisfied_requirement']['result_id'] == 123
+    assert lines[2] == {'result': make_result(outcome='PASSED')}
+
+
+def test_make_decision_ndjson_upstream_error():
+    """
+    Test that verbose results are retrieved before streaming the response
+    even if no rule needs them.
+    """
+    policies = """
+        --- !Policy
+        id: "test_policy"
+        product_versions:
+          - fedora-rawhide
+        decision_context: test_policies
+        subject_type: koji_build
+        rules: []
+        """
+    app = create_app('greenwave.config.TestingConfig')
+    app.config['policies'] = Policy.safe_load_all(dedent(policies))
+    client = app.test_client()
+    error = requests.HTTPError(
+        response=ErrorResponse(503, 'Upstream error', 'http://localhost:5001'))
+    with mock.patch('greenwave.resources.ResultsRetriever._retrieve_data', side_effect=error), \
+            mock.patch('greenwave.resources.WaiversRetriever._retrieve_data', return_value=[]):
+        response = client.post(
+            '/api/v1.0/decision', json=dict(DEFAULT_DECISION_DATA, verbose=True),
+            headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 502
+
+
+def test_make_decisions_ndjson(mock_results, mock_waivers):
+    app = create_app('greenwave.config.TestingConfig')
+    app.config['policies'] = Policy.safe_load_all(dedent(DEFAULT_DECISION_POLICIES))
+    client = app.test_client()
+    response = client.post(
+        '/api/v1.0/decisions',
+        json={'decisions': [DEFAULT_DECISION_DATA, {}]},
+        headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+    assert [line['status'] for line in lines] == [200, 415]
+    assert lines[0]['decision']['summary'] == '1 of 1 required test results missing'
+
+
+@pytest.mark.parametrize('upstream_status, status', ((503, 502), (504, 504)))
+def test_make_decisions_upstream_error(mock_results, mock_waivers, upstream_status, status):
+    response = ErrorResponse(upstream_status, 'Upstream error', 'http://localhost:5001')
+    mock_results.side_effect = requests.HTTPError(response=response)
+    app = create_app('greenwave.config.TestingConfig')
+    app.config['policies'] = Policy.safe_load_all(dedent(DEFAULT_DECISION_POLICIES))
+    client = app.test_client()
+    response = client.post(
+        '/api/v1.0/decisions', json={'decisions': [DEFAULT_DECISION_DATA, {}]})
+    assert response.status_code == 200
+    assert [item['status'] for item in response.json['decisions']] == [status, 415]
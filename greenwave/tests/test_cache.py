@@ -0,0 +1,104 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+import mock
+import pytest
+from dogpile.cache import make_region
+
+from greenwave.app_factory import create_app
+from greenwave.cache import LRUCache, cached, cached_value, local_caches
+
+
+def test_lru_cache_drops_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+
+    cache.set('c', 3)
+    assert len(cache) == 2
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(maxsize=2, ttl=10)
+    with mock.patch('time.monotonic', return_value=100):
+        cache.set('a', 1)
+
+    with mock.patch('time.monotonic', return_value=109):
+        assert cache.get('a') == 1
+
+    with mock.patch('time.monotonic', return_value=110):
+        assert cache.get('a', 'expired') == 'expired'
+
+    assert len(cache) == 0
+
+
+def test_lru_cache_counters():
+    hit_counter = mock.Mock()
+    miss_counter = mock.Mock()
+    cache = LRUCache(maxsize=2, hit_counter=hit_counter, miss_counter=miss_counter)
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert cache.get('a') == 1
+
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert hit_counter.inc.call_count == 2
+    assert miss_counter.inc.call_count == 1
+
+
+def test_lru_cache_disabled():
+    cache = LRUCache(maxsize=0)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+
+
+def expensive(arg):
+    expensive.calls.append(arg)
+    return arg.upper()
+
+
+@pytest.fixture
+def two_tier_app():
+    app = create_app('greenwave.config.TestingConfig')
+    app.config['LOCAL_CACHE'] = {'expensive': {'maxsize': 10, 'ttl': 60}}
+    app.local_caches = local_caches(app.config)
+    app.cache = make_region().configure('dogpile.cache.memory')
+    expensive.calls = []
+    with app.app_context():
+        yield app
+
+
+def test_cached_uses_local_cache(two_tier_app):
+    cached_expensive = cached(expensive)
+    assert cached_expensive('a') == 'A'
+    assert cached_expensive('a') == 'A'
+    assert expensive.calls == ['a']
+    assert cached_value(expensive, 'a') == 'A'
+
+    local_cache = two_tier_app.local_caches['expensive']
+    assert (local_cache.hits, local_cache.misses) == (2, 1)
+
+
+def test_cached_falls_back_to_shared_cache(two_tier_app):
+    cached_expensive = cached(expensive)
+    assert cached_expensive('a') == 'A'
+
+    # Value evicted from local cache (e.g. in other process) is retrieved
+    # from shared cache.
+    two_tier_app.local_caches['expensive'].clear()
+    with mock.patch('greenwave.cache.cache_hit_counter') as hit_counter:
+        assert cached_expensive('a') == 'A'
+    assert expensive.calls == ['a']
+    hit_counter.labels.assert_called_once_with(tier='shared', function='expensive')
+    assert len(two_tier_app.local_caches['expensive']) == 1
+
+
+def test_cached_without_local_cache(two_tier_app):
+    two_tier_app.local_caches = {}
+    cached_expensive = cached(expensive)
+    assert cached_expensive('a') == 'A'
+    assert cached_expensive('a') == 'A'
+    assert expensive.calls == ['a']
@@ -0,0 +1,117 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+import mock
+import pytest
+
+from greenwave.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    PROBE,
+    REQUEST,
+    CircuitBreaker,
+    circuit_breaker,
+)
+
+
+@pytest.fixture
+def monotonic():
+    with mock.patch('greenwave.circuit_breaker.time.monotonic', return_value=100.0) as mocked:
+        yield mocked
+
+
+def failing_breaker():
+    breaker = CircuitBreaker('test', failure_rate=0.5, min_requests=4, window=10, reset_timeout=5)
+    for failed in (False, True, False, True):
+        token = breaker.allow_request()
+        assert token == REQUEST
+        breaker.record(token, failed=failed)
+    return breaker
+
+
+def test_circuit_breaker_opens(monotonic):
+    breaker = CircuitBreaker('test', failure_rate=0.5, min_requests=4, window=10, reset_timeout=5)
+    for _ in range(3):
+        breaker.record(breaker.allow_request(), failed=True)
+    assert breaker.state == CLOSED
+
+    breaker.record(breaker.allow_request(), failed=True)
+    assert breaker.state == OPEN
+    assert breaker.allow_request() is None
+
+
+def test_circuit_breaker_forgets_old_failures(monotonic):
+    breaker = CircuitBreaker('test', failure_rate=0.5, min_requests=4, window=10, reset_timeout=5)
+    for _ in range(3):
+        breaker.record(REQUEST, failed=True)
+
+    monotonic.return_value += 11
+    for _ in range(3):
+        breaker.record(REQUEST, failed=False)
+    breaker.record(REQUEST, failed=True)
+    assert breaker.state == CLOSED
+
+
+def test_circuit_breaker_half_open_success(monotonic):
+    breaker = failing_breaker()
+    assert breaker.state == OPEN
+
+    monotonic.return_value += 5
+    assert breaker.allow_request() == PROBE
+    assert breaker.state == HALF_OPEN
+    # Only a single probe request is allowed.
+    assert breaker.allow_request() is None
+
+    breaker.record(PROBE, failed=False)
+    assert breaker.state == CLOSED
+    assert breaker.allow_request() == REQUEST
+
+
+def test_circuit_breaker_half_open_failure(monotonic):
+    breaker = failing_breaker()
+
+    monotonic.return_value += 5
+    assert breaker.allow_request() == PROBE
+    breaker.record(PROBE, failed=True)
+    assert breaker.state == OPEN
+
+    monotonic.return_value += 4
+    assert breaker.allow_request() is None
+
+
+def test_circuit_breaker_half_open_ignores_other_requests(monotonic):
+    breaker = CircuitBreaker('test', failure_rate=0.5, min_requests=4, window=10, reset_timeout=5)
+    slow_tokens = [breaker.allow_request() for _ in range(2)]
+    for _ in range(4):
+        breaker.record(breaker.allow_request(), failed=True)
+    assert breaker.state == OPEN
+
+    monotonic.return_value += 5
+    probe = breaker.allow_request()
+    assert probe == PROBE
+
+    # Requests sent before the circuit opened finish while the probe is
+    # still in flight.
+    breaker.record(slow_tokens[0], failed=False)
+    assert breaker.state == HALF_OPEN
+    breaker.record(slow_tokens[1], failed=True)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request() is None
+
+    breaker.record(probe, failed=False)
+    assert breaker.state == CLOSED
+
+
+@mock.patch('greenwave.circuit_breaker._circuit_breakers', {})
+def test_circuit_breaker_options(app):
+    assert circuit_breaker('resultsdb') is None
+
+    app.config['CIRCUIT_BREAKER_ENABLED'] = True
+    app.config['CIRCUIT_BREAKER_UPSTREAMS'] = {'koji': {'reset_timeout': 10}}
+    resultsdb_breaker = circuit_breaker('resultsdb')
+    assert resultsdb_breaker is circuit_breaker('resultsdb')
+    assert resultsdb_breaker.reset_timeout == 30
+
+    koji_breaker = circuit_breaker('koji')
+    assert koji_breaker.upstream == 'koji'
+    assert koji_breaker.reset_timeout == 10
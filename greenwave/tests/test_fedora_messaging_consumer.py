@@ -0,0 +1,69 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+import mock
+import pytest
+
+import greenwave.app_factory
+from greenwave.consumers import fedora_messaging_consumer
+from greenwave.consumers.resultsdb import ResultsDBHandler
+from greenwave.consumers.waiverdb import WaiverDBHandler
+
+CONSUMER_CONFIG = {
+    'topic_prefix': 'org.fedoraproject',
+    'environment': 'prod',
+    'resultsdb_topic_suffix': 'resultsdb.result.new',
+    'waiverdb_topic_suffix': 'waiver.new',
+}
+
+
+@pytest.fixture(autouse=True)
+def consumer_state(monkeypatch):
+    monkeypatch.setattr(fedora_messaging_consumer, '_flask_app', None)
+    monkeypatch.setattr(fedora_messaging_consumer, '_handlers', {})
+    monkeypatch.setattr(
+        fedora_messaging_consumer, 'conf', {'consumer_config': CONSUMER_CONFIG})
+
+
+def make_message(topic):
+    message = mock.Mock()
+    message.topic = topic
+    message.body = {}
+    return message
+
+
+@mock.patch.object(WaiverDBHandler, 'consume')
+@mock.patch.object(ResultsDBHandler, 'consume')
+def test_handlers_and_app_reused(consume_result, consume_waiver):
+    create_app = mock.Mock(wraps=greenwave.app_factory.create_app)
+    with mock.patch('greenwave.app_factory.create_app', create_app):
+        for _ in range(3):
+            fedora_messaging_consumer.fedora_messaging_callback(
+                make_message('org.fedoraproject.prod.resultsdb.result.new'))
+            fedora_messaging_consumer.fedora_messaging_callback(
+                make_message('org.fedoraproject.prod.waiverdb.waiver.new'))
+
+    create_app.assert_called_once()
+    assert len(consume_result.mock_calls) == 3
+    assert len(consume_waiver.mock_calls) == 3
+
+    handlers = list(fedora_messaging_consumer._handlers.values())
+    assert [type(handler) for handler in handlers] == [ResultsDBHandler, WaiverDBHandler]
+    assert handlers[0].flask_app is handlers[1].flask_app
+
+
+@pytest.mark.benchmark
+@mock.patch.object(ResultsDBHandler, 'consume')
+def test_benchmark_per_message_overhead(consume, compare_timings):
+    """
+    Compares per-message overhead of creating new handler (and Flask app)
+    for each message with reusing a single handler.
+    """
+    message = make_message('org.fedoraproject.prod.resultsdb.result.new')
+    hub = fedora_messaging_consumer.Dummy(CONSUMER_CONFIG)
+
+    new_handler_overhead, reused_handler_overhead = compare_timings(
+        lambda: ResultsDBHandler(hub).consume({'body': {'msg': message.body}}),
+        lambda: fedora_messaging_consumer.fedora_messaging_callback(message),
+        count=20,
+    )
+    assert reused_handler_overhead < new_handler_overhead
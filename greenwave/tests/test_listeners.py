@@ -1,21 +1,28 @@
 # SPDX-License-Identifier: GPL-2.0+
 import json
+import threading
+import time
 from textwrap import dedent
 
 import mock
 import pytest
 import stomp
+from dogpile.cache.api import NO_VALUE
 from requests.exceptions import HTTPError
 
 from greenwave.app_factory import create_app
+from greenwave.config import TestingConfig
 from greenwave.listeners.waiverdb import WaiverDBListener
 from greenwave.listeners.resultsdb import ResultsDBListener
+from greenwave.listeners.workers import Coalescer, OrderedWorkerPool
 from greenwave.monitor import (
+    decision_failed_counter,
     messaging_rx_counter,
     messaging_rx_ignored_counter,
 )
 from greenwave.policies import Policy
 from greenwave.product_versions import subject_product_version
+from greenwave.resources import ResultsRetriever
 from greenwave.subjects.factory import create_subject
 
 DECISION_UPDATE_TOPIC = "/topic/VirtualTopic.eng.greenwave.decision.update"
@@ -106,16 +113,14 @@ def waiverdb_listener():
 
 
 @pytest.fixture(autouse=True)
-def mock_retrieve_decision():
-    with mock.patch("greenwave.decision.make_decision") as mocked:
-
-        def retrieve_decision(data, _config):
-            if "when" in data:
-                return {"policies_satisfied": False}
-            return {"policies_satisfied": True}
+def mock_retrieve_decision(mock_make_decision):
+    def retrieve_decision(data, _config):
+        if "when" in data:
+            return {"policies_satisfied": False}
+        return {"policies_satisfied": True}
 
-        mocked.side_effect = retrieve_decision
-        yield mocked
+    mock_make_decision.side_effect = retrieve_decision
+    yield mock_make_decision
 
 
 @pytest.fixture
@@ -409,6 +414,49 @@ def test_decision_does_not_change(
     assert len(mock_connection.send.mock_calls) == 0
 
 
+def test_decision_failed_in_one_context(
+    mock_retrieve_decision,
+    mock_retrieve_results,
+    mock_connection,
+):
+    """
+    Test that an error in any decision context fails decisions in all
+    decision contexts of the message.
+    """
+    policies = POLICIES_DEFAULT + dedent(
+        """
+    --- !Policy
+    id: another_test_policy
+    product_versions: [fedora-rawhide]
+    decision_context: another_test_context
+    subject_type: koji_build
+    rules:
+      - !PassingTestCaseRule {test_case_name: dist.rpmdeplint}
+"""
+    )
+
+    def retrieve_decision(data, _config):
+        if data["decision_context"] == "another_test_context":
+            raise HTTPError()
+        return {"policies_satisfied": "when" not in data}
+
+    mock_retrieve_decision.side_effect = retrieve_decision
+
+    listener = resultsdb_listener(policies)
+    listener._inc = mock.Mock()
+
+    with listener.app.app_context():
+        listener.on_message(DummyMessage())
+
+    assert len(mock_connection.send.mock_calls) == 0
+    listener._inc.assert_has_calls(
+        [
+            mock.call(decision_failed_counter.labels(decision_context="another_test_context")),
+            mock.call(decision_failed_counter.labels(decision_context="test_context")),
+        ]
+    )
+
+
 @pytest.mark.parametrize("outcome", ("QUEUED", "RUNNING"))
 def test_decision_does_not_change_on_incomplete_outcome(
     mock_retrieve_decision,
@@ -1043,7 +1091,8 @@ def test_listener_send_failure(mock_connection):
         listener.on_message(DummyMessage())
 
     assert len(mock_connection.send.mock_calls) == 1
-    assert len(mock_connection.ack.mock_calls) == 1
+    assert len(mock_connection.ack.mock_calls) == 0
+    assert len(mock_connection.nack.mock_calls) == 1
 
 
 def test_listener_nack_after_disconnect(mock_connection):
@@ -1120,3 +1169,140 @@ def test_listener_receive_non_json_message(mock_connection):
             mock.call(messaging_rx_ignored_counter),
         ]
     )
+
+
+def test_worker_pool_keeps_order_for_same_key():
+    pool = OrderedWorkerPool(workers=4, max_pending=10)
+    processed = []
+    thread_names = set()
+
+    def process(key, index):
+        time.sleep(0.01 * (3 - index))
+        thread_names.add(threading.current_thread().name)
+        processed.append((key, index))
+
+    for index in range(3):
+        for key in ("a", "b"):
+            pool.submit(key, process, key, index)
+    pool.join()
+    pool.shutdown()
+
+    assert [index for key, index in processed if key == "a"] == [0, 1, 2]
+    assert [index for key, index in processed if key == "b"] == [0, 1, 2]
+    assert len(thread_names) == 2
+
+
+def test_listener_with_workers(mock_retrieve_results, mock_connection):
+    """
+    Test processing messages in worker threads and acknowledging them after
+    they are processed.
+    """
+    with mock.patch.object(TestingConfig, "LISTENER_WORKERS", 2):
+        listener = resultsdb_listener()
+
+    mock_connection.subscribe.assert_called_once_with(
+        destination=RESULTSDB_QUEUE,
+        id=listener.uid,
+        ack="client-individual",
+        headers={"activemq.prefetchSize": 100},
+    )
+
+    listener.on_message(DummyMessage())
+    listener.on_message(DummyMessage(nvr="nethack-1.2.4-1.rawhide"))
+    listener.worker_pool.join()
+
+    assert len(mock_connection.send.mock_calls) == 2
+    assert len(mock_connection.ack.mock_calls) == 2
+    assert len(mock_connection.nack.mock_calls) == 0
+
+
+def test_coalescer_groups_items_by_key():
+    flushed = []
+    coalescer = Coalescer(60, lambda key, items: flushed.append((key, items)))
+
+    coalescer.add("a", 1)
+    coalescer.add("b", 2)
+    coalescer.add("a", 3)
+    assert flushed == []
+
+    coalescer.flush_all()
+    assert sorted(flushed) == [("a", [1, 3]), ("b", [2])]
+    assert coalescer.groups == {}
+
+
+def test_coalescer_flushes_groups_in_order():
+    flushed = []
+    done = threading.Event()
+
+    def flush(key, items):
+        flushed.append((key, items, threading.current_thread().name))
+        if len(flushed) == 2:
+            done.set()
+
+    coalescer = Coalescer(0.01, flush)
+    coalescer.add("b", 1)
+    coalescer.add("a", 2)
+    coalescer.add("b", 3)
+    assert done.wait(timeout=5)
+    assert flushed == [
+        ("b", [1, 3], "listener-coalescer"),
+        ("a", [2], "listener-coalescer"),
+    ]
+
+
+def test_listener_coalesces_messages(
+    mock_retrieve_decision, mock_retrieve_results, mock_connection
+):
+    """
+    Test publishing decision change only once for multiple messages for the
+    same subject, comparing with decision before the earliest result.
+    """
+    with mock.patch.object(TestingConfig, "LISTENER_RESULTSDB_COALESCE_SECONDS", 60):
+        listener = resultsdb_listener()
+
+    submit_times = (
+        "2019-03-25T16:34:42.000000",
+        "2019-03-25T16:34:41.000000",
+        "2019-03-25T16:34:43.000000",
+    )
+    for submit_time in submit_times:
+        listener.on_message(DummyMessage(submit_time=submit_time))
+
+    assert len(mock_connection.send.mock_calls) == 0
+    assert len(mock_connection.ack.mock_calls) == 0
+
+    # Coalesced messages are processed before disconnecting.
+    mock_connection.is_connected.side_effect = None
+    mock_connection.is_connected.return_value = True
+    listener.disconnect()
+
+    assert len(mock_connection.send.mock_calls) == 1
+    assert len(mock_connection.ack.mock_calls) == 3
+    assert len(mock_connection.nack.mock_calls) == 0
+
+    whens = [
+        call.args[0].get("when") for call in mock_retrieve_decision.call_args_list
+    ]
+    assert whens == [None, "2019-03-25T16:34:40.999999"]
+
+
+def test_listener_invalidates_cached_results(mock_retrieve_results, mock_connection):
+    """
+    Test removing cached results for subject and test case of new result.
+    """
+    with mock.patch.object(TestingConfig, "CACHE", {"backend": "dogpile.cache.memory"}):
+        listener = resultsdb_listener()
+
+    with listener.app.app_context():
+        subject = create_subject("koji_build", DUMMY_NVR)
+    key = ResultsRetriever._external_cache_key(subject, "dist.rpmdeplint")
+    other_key = ResultsRetriever._external_cache_key(subject, "dist.abicheck")
+    listener.app.cache.set(key, [{"id": 1}])
+    listener.app.cache.set(other_key, [{"id": 2}])
+
+    listener.on_message(DummyMessage(outcome="RUNNING"))
+
+    assert listener.app.cache.get(key) is NO_VALUE
+    assert listener.app.cache.get(other_key) == [{"id": 2}]
+    watermark_key = ResultsRetriever._watermark_key(subject, "dist.rpmdeplint")
+    assert listener.app.cache.get(watermark_key) == "2019-03-25T16:34:41.882620"
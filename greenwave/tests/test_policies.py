@@ -3,14 +3,20 @@
 
 import pytest
 import mock
+import threading
 import time
 
 from textwrap import dedent
 
+from flask import current_app
+
 from greenwave.app_factory import create_app
-from greenwave.decision import Decision
+from greenwave.decision import Decision, make_decision, make_subject_decisions
 from greenwave.policies import (
+    applicable_decision_context_product_version_pairs,
     load_policies,
+    matching_policies,
+    PolicyIndex,
     summarize_answers,
     Policy,
     RemotePolicy,
@@ -56,7 +62,8 @@ class DummyResultsRetriever(ResultsRetriever):
         if (self.subject and (params.get('item') == self.subject.identifier or
                               params.get('nvr') == self.subject.identifier) and
                 ('type' not in params or self.subject.type in params['type'].split(',')) and
-                (params.get('testcases') is None or params.get('testcases') == self.testcase)):
+                (params.get('testcases') is None or
+                 self.testcase in params['testcases'].split(','))):
             return [{
                 'id': 123,
                 'data': {
@@ -665,7 +672,8 @@ def test_get_sub_policies_multiple_urls(tmpdir):
     with app.app_context():
         with mock.patch('greenwave.resources.retrieve_scm_from_koji') as scm:
             scm.return_value = ('rpms', 'nethack', 'c3c47a08a66451cb9686c49f040776ed35a0d1bb')
-            with mock.patch('greenwave.resources.requests_session') as session:
+            with mock.patch('greenwave.resources.upstream_session') as upstream_session:
+                session = upstream_session.return_value
                 response = mock.MagicMock()
                 response.status_code = 404
                 session.request.return_value = response
@@ -678,12 +686,12 @@ def test_get_sub_policies_multiple_urls(tmpdir):
                 decision = Decision(None, 'fedora-26')
                 decision.check(subject, [policy], results)
                 expected_call1 = mock.call(
-                    'HEAD', 'https://src1.fp.org/{0}/{1}/raw/{2}/f/gating.yaml'.format(
+                    'GET', 'https://src1.fp.org/{0}/{1}/raw/{2}/f/gating.yaml'.format(
                         *scm.return_value
                     )
                 )
                 expected_call2 = mock.call(
-                    'HEAD', 'https://src2.fp.org/{0}/{1}/raw/{2}/f/gating.yaml'.format(
+                    'GET', 'https://src2.fp.org/{0}/{1}/raw/{2}/f/gating.yaml'.format(
                         *scm.return_value
                     )
                 )
@@ -706,22 +714,23 @@ def test_redhat_container_image_subject_type():
         req_get.json.return_value = {'data': {'item': [nvr]}}
         retriever._retrieve_all(rh_img_subject, testcase_name)  # pylint: disable=W0212
         assert req_get.call_count == 2
-        assert req_get.call_args_list[0] == mock.call(
+        # Requests are sent concurrently.
+        assert mock.call(
             f'{rdb_url}/results/latest',
             params={'nvr': nvr,
                     'type': 'redhat-container-image',
                     '_distinct_on': 'scenario,system_architecture,system_variant',
                     'since': f'1900-01-01T00:00:00.000000,{cur_time}',
                     'testcases': testcase_name}
-        )
-        assert req_get.call_args_list[1] == mock.call(
+        ) in req_get.call_args_list
+        assert mock.call(
             f'{rdb_url}/results/latest',
             params={'item': nvr,
                     'type': 'koji_build',
                     '_distinct_on': 'scenario,system_architecture,system_variant',
                     'since': f'1900-01-01T00:00:00.000000,{cur_time}',
                     'testcases': testcase_name}
-        )
+        ) in req_get.call_args_list
 
 
 def test_remote_rule_policy_optional_id(tmpdir):
@@ -1509,3 +1518,379 @@ def test_cache_passing_results():
     cached = results4.retrieve(subject, testcase='sometest')
     assert results4.retrieve_data_called == 0
     assert cached == retrieved2
+
+
+def test_cache_all_results():
+    """
+    All results, including failing and missing, are stored in external cache
+    if enabled (cached results are invalidated on new result messages).
+    """
+    current_app.config['CACHE_ALL_RESULTS'] = True
+    subject = create_subject('bodhi_update', 'update-1')
+    results = DummyResultsRetriever(subject, 'sometest', 'FAILED')
+
+    retrieved = results.retrieve(subject, testcase='sometest')
+    assert results.retrieve_data_called == 1
+    assert retrieved
+    missing = results.retrieve(subject, testcase='othertest')
+    assert results.retrieve_data_called == 2
+    assert missing == []
+
+    results2 = DummyResultsRetriever(subject, 'sometest', 'PASSED')
+    results2.external_cache = results.external_cache
+    assert results2.retrieve(subject, testcase='sometest') == retrieved
+    assert results2.retrieve(subject, testcase='othertest') == []
+    assert results2.retrieve_data_called == 0
+
+
+def test_cache_results_older_than_watermark():
+    """
+    Results retrieved before a newer result was announced are not stored in
+    external cache.
+    """
+    current_app.config['CACHE_ALL_RESULTS'] = True
+    subject = create_subject('bodhi_update', 'update-1')
+    key = ResultsRetriever._external_cache_key(subject, 'sometest')
+    watermark_key = ResultsRetriever._watermark_key(subject, 'sometest')
+
+    results = DummyResultsRetriever(subject, 'sometest', 'FAILED')
+    results.external_cache[watermark_key] = '2021-03-25T07:26:56.191742'
+    assert results.retrieve(subject, testcase='sometest')
+    assert key not in results.external_cache
+
+    results = DummyResultsRetriever(subject, 'sometest', 'FAILED')
+    results.external_cache[watermark_key] = '2021-03-25T07:26:56.191741'
+    assert results.retrieve(subject, testcase='sometest')
+    assert key in results.external_cache
+
+
+def test_cache_all_results_ignores_results_before_when():
+    """
+    Results retrieved for a decision in the past are not stored in external
+    cache which is used by decisions for the latest results.
+    """
+    current_app.config['CACHE_ALL_RESULTS'] = True
+    subject = create_subject('bodhi_update', 'update-1')
+
+    results = DummyResultsRetriever(
+        subject, 'sometest', 'PASSED', when='2021-03-25T07:26:56.191740')
+    results.subject = None
+    assert results.retrieve(subject, testcase='sometest') == []
+    assert results.external_cache == {}
+
+    latest_results = DummyResultsRetriever(subject, 'sometest', 'PASSED')
+    latest_results.external_cache = results.external_cache
+    assert latest_results.retrieve(subject, testcase='sometest')
+    assert latest_results.retrieve_data_called == 1
+
+
+def test_refresh_cached_results():
+    """
+    Cached results are ignored and replaced with results from ResultsDB
+    when processing a new result.
+    """
+    current_app.config['CACHE_ALL_RESULTS'] = True
+    subject = create_subject('bodhi_update', 'update-1')
+    key = ResultsRetriever._external_cache_key(subject, 'sometest')
+
+    results = DummyResultsRetriever(subject, 'sometest', 'PASSED')
+    results.external_cache[key] = []
+    ResultsRetriever.refresh_external_cache(subject, ['sometest'])
+    retrieved = results.retrieve(subject, testcase='sometest')
+    assert results.retrieve_data_called == 1
+    assert retrieved
+    assert results.external_cache[key] == retrieved
+
+
+def test_retrieve_all_testcases_in_single_query(tmpdir):
+    """
+    Results for all test cases required by applicable policies are retrieved
+    with single query.
+    """
+    p = tmpdir.join('fedora.yaml')
+    p.write(dedent("""
+        --- !Policy
+        id: "some_policy"
+        product_versions:
+          - fedora-rawhide
+        decision_context: test
+        subject_type: koji_build
+        rules:
+          - !PassingTestCaseRule {test_case_name: sometest1}
+          - !PassingTestCaseRule {test_case_name: sometest2}
+          - !PassingTestCaseRule {test_case_name: sometest3}
+        """))
+    policies = load_policies(tmpdir.strpath)
+
+    subject = create_subject('koji_build', 'nethack-1.2.3-1.rawhide')
+    results = DummyResultsRetriever(subject, 'sometest2')
+    with mock.patch.object(
+            results, '_retrieve_data', wraps=results._retrieve_data) as retrieve_data:
+        decision = Decision('test', 'fedora-rawhide')
+        decision.check(subject, policies, results)
+
+    assert answer_types(decision.answers) == [
+        'test-result-missing', 'test-result-passed', 'test-result-missing']
+    # One query for each subject result query.
+    assert retrieve_data.call_count == 2
+    for call in retrieve_data.call_args_list:
+        assert call[0][0]['testcases'] == 'sometest1,sometest2,sometest3'
+
+
+def test_retrieve_pending_testcases_with_first_query():
+    subject = create_subject('koji_build', 'nethack-1.2.3-1.rawhide')
+    results = DummyResultsRetriever(subject, 'sometest1')
+    results.prefetch(subject, ['sometest2', 'sometest3'])
+
+    assert results.retrieve(subject, testcase='sometest1')
+    assert results.retrieve_data_called == 2
+
+    assert results.retrieve(subject, testcase='sometest2') == []
+    assert results.retrieve(subject, testcase='sometest3') == []
+    assert results.retrieve_data_called == 2
+
+
+def test_retrieve_results_for_all_subjects_concurrently(tmpdir):
+    p = tmpdir.join('fedora.yaml')
+    p.write(dedent("""
+        --- !Policy
+        id: "some_policy"
+        product_versions:
+          - fedora-rawhide
+        decision_context: test
+        subject_type: koji_build
+        rules:
+          - !PassingTestCaseRule {test_case_name: sometest1}
+          - !PassingTestCaseRule {test_case_name: sometest2}
+        """))
+    policies = load_policies(tmpdir.strpath)
+
+    subjects = [
+        create_subject('koji_build', 'nethack-1.2.3-1.rawhide'),
+        create_subject('koji_build', 'nethack-1.2.4-1.rawhide'),
+    ]
+    results = DummyResultsRetriever(subjects[1], 'sometest1')
+    thread_names = set()
+
+    def retrieve_data(params):
+        thread_names.add(threading.current_thread().name)
+        time.sleep(0.01)
+        return DummyResultsRetriever._retrieve_data(results, params)
+
+    with mock.patch.object(results, '_retrieve_data', side_effect=retrieve_data):
+        decision = Decision('test', 'fedora-rawhide')
+        decision.check_subjects(subjects, policies, results)
+
+    assert results.retrieve_data_called == 4
+    assert len(thread_names) > 1
+    answers = [
+        (answer.subject.identifier, answer.to_json()['type'])
+        for answer in decision.answers
+    ]
+    assert answers == [
+        ('nethack-1.2.3-1.rawhide', 'test-result-missing'),
+        ('nethack-1.2.3-1.rawhide', 'test-result-missing'),
+        ('nethack-1.2.4-1.rawhide', 'test-result-passed'),
+        ('nethack-1.2.4-1.rawhide', 'test-result-missing'),
+    ]
+
+
+def test_retrieve_results_serially_if_concurrency_disabled():
+    subject = create_subject('koji_build', 'nethack-1.2.3-1.rawhide')
+    results = DummyResultsRetriever(subject, 'sometest1')
+    results.max_concurrent_requests = 1
+    with mock.patch('greenwave.resources.ThreadPoolExecutor') as executor:
+        assert results.retrieve(subject, testcase='sometest1')
+    executor.assert_not_called()
+    assert results.retrieve_data_called == 2
+
+
+@pytest.mark.parametrize('submit_time, expected_results_queries', (
+    ('2021-01-01T00:00:00.000000', 2),
+    ('2022-01-01T00:00:00.000000', 4),
+))
+def test_old_decision_reuses_latest_data(submit_time, expected_results_queries):
+    current_app.config['policies'] = Policy.safe_load_all(dedent("""
+        --- !Policy
+        id: "some_policy"
+        product_versions:
+          - fedora-rawhide
+        decision_context: test
+        subject_type: koji_build
+        rules:
+          - !PassingTestCaseRule {test_case_name: sometest}
+        """))
+    nvr = 'nethack-1.2.3-1.rawhide'
+    result = {
+        'id': 1,
+        'testcase': {'name': 'sometest'},
+        'outcome': 'FAILED',
+        'data': {'item': [nvr], 'type': ['koji_build']},
+        'submit_time': submit_time,
+    }
+    waiver = {
+        'id': 1,
+        'subject_type': 'koji_build',
+        'subject_identifier': nvr,
+        'product_version': 'fedora-rawhide',
+        'testcase': 'sometest',
+        'timestamp': '2021-01-01T00:00:00.000000',
+        'waived': True,
+    }
+    data = {
+        'decision_context': 'test',
+        'product_version': 'fedora-rawhide',
+        'subject_type': 'koji_build',
+        'subject_identifier': nvr,
+    }
+
+    with mock.patch('greenwave.resources.ResultsRetriever._retrieve_data') as results, \
+            mock.patch('greenwave.resources.WaiversRetriever._retrieve_data') as waivers:
+        results.side_effect = lambda params: [result] if 'item' in params else []
+        waivers.return_value = [waiver]
+        decision = make_decision(data, current_app.config)
+        old_decision = make_decision(
+            dict(data, when='2021-06-01T00:00:00.000000'), current_app.config)
+
+    assert decision['summary'] == 'All required tests passed'
+    assert old_decision == decision
+    assert results.call_count == expected_results_queries
+    assert results.call_args[0][0].get('since') == (
+        None if expected_results_queries == 2
+        else '1900-01-01T00:00:00.000000,2021-06-01T00:00:00.000000')
+    # Waivers were created before "when".
+    assert waivers.call_count == 1
+
+
+def test_make_subject_decisions_shares_data():
+    current_app.config['policies'] = Policy.safe_load_all(dedent("""
+        --- !Policy
+        id: "policy1"
+        product_versions:
+          - fedora-rawhide
+        decision_context: test1
+        subject_type: koji_build
+        rules:
+          - !PassingTestCaseRule {test_case_name: sometest1}
+        --- !Policy
+        id: "policy2"
+        product_versions:
+          - fedora-rawhide
+        decision_context: test2
+        subject_type: koji_build
+        rules:
+          - !PassingTestCaseRule {test_case_name: sometest2}
+        """))
+    subject = create_subject('koji_build', 'nethack-1.2.3-1.rawhide')
+    contexts_product_versions = [('test1', 'fedora-rawhide'), ('test2', 'fedora-rawhide')]
+
+    with mock.patch('greenwave.resources.ResultsRetriever._retrieve_data') as results, \
+            mock.patch('greenwave.resources.WaiversRetriever._retrieve_data') as waivers:
+        results.return_value = []
+        waivers.return_value = []
+        decisions = make_subject_decisions(
+            subject, contexts_product_versions, current_app.config)
+
+    assert {
+        key: decision['applicable_policies'] for key, decision in decisions.items()
+    } == {
+        ('test1', 'fedora-rawhide'): ['policy1'],
+        ('test2', 'fedora-rawhide'): ['policy2'],
+    }
+    # One query for each subject result query.
+    assert results.call_count == 2
+    assert results.call_args[0][0]['testcases'] == 'sometest1,sometest2'
+    waivers.assert_called_once()
+    assert [f['testcase'] for f in waivers.call_args[0][0]] == ['sometest1', 'sometest2']
+
+
+def many_policies(count):
+    return Policy.safe_load_all(''.join(dedent(f"""
+        --- !Policy
+        id: policy_{i}
+        product_versions:
+          - fedora-{i % 40}
+          - rhel-{i % 10}.*
+        decision_contexts: [context_{i % 50}, context_all]
+        subject_type: {('koji_build', 'compose', 'redhat-module')[i % 3]}
+        rules:
+          - !PassingTestCaseRule {{test_case_name: test_{i % 7}}}
+        """) for i in range(count)))
+
+
+@pytest.mark.parametrize('attributes', (
+    {},
+    {'decision_context': 'context_all'},
+    {'decision_context': 'context_1', 'product_version': 'fedora-1'},
+    {'decision_context': 'context_2', 'product_version': 'rhel-2.1'},
+    {'decision_context': 'context_3', 'product_version': 'fedora-99'},
+    {'decision_context': 'missing', 'product_version': 'fedora-1'},
+    {'product_version': 'rhel-4.0', 'testcase': 'test_3'},
+    {'product_version': 'fedora-7', 'subject_type': 'koji_build'},
+    {'testcase': 'test_1', 'subject_type': 'compose'},
+))
+def test_policy_index_matches_linear_scan(attributes):
+    policies = many_policies(200)
+    index = PolicyIndex(policies)
+
+    subject_type = attributes.pop('subject_type', None)
+    if subject_type:
+        attributes['subject'] = create_subject(subject_type, 'nethack-1.2.3-1.el9')
+
+    expected = [policy for policy in policies if policy.matches(**attributes)]
+    assert index.matching(**attributes) == expected
+    assert matching_policies(index, **attributes) == expected
+    assert (
+        applicable_decision_context_product_version_pairs(index, **attributes) ==
+        applicable_decision_context_product_version_pairs(policies, **attributes)
+    )
+
+
+def test_load_policies_returns_index():
+    assert isinstance(current_app.config['policies'], PolicyIndex)
+
+
+@pytest.mark.benchmark
+def test_benchmark_policy_index(compare_timings):
+    """
+    Compares looking up matching policies using the index with the linear
+    scan.
+    """
+    policies = many_policies(2000)
+    index = PolicyIndex(policies)
+    subject = create_subject('koji_build', 'nethack-1.2.3-1.el9')
+    attributes = dict(
+        decision_context='context_1', product_version='rhel-1.0', subject=subject)
+
+    linear_time, index_time = compare_timings(
+        lambda: matching_policies(policies, **attributes),
+        lambda: matching_policies(index, **attributes),
+        count=200,
+    )
+    assert index_time < linear_time
+
+
+@pytest.mark.parametrize('name, expected', (
+    ('nethack', True),
+    ('python-requests', True),
+    ('python-excluded', False),
+    ('python3', False),
+    ('kernel', False),
+    ('glibc', True),
+))
+def test_policy_matches_package(name, expected):
+    policy = Policy.safe_load_all(dedent("""
+        --- !Policy
+        id: some_policy
+        product_versions: [fedora-*, "rhel-9.?"]
+        decision_context: test
+        subject_type: koji_build
+        packages: [nethack, python-*, "glib?"]
+        excluded_packages: ["*-excluded"]
+        rules: []
+        """))[0]
+    assert policy.matches_package(name) == expected
+    assert policy.matches_product_version('fedora-rawhide')
+    assert policy.matches_product_version('rhel-9.1')
+    assert not policy.matches_product_version('rhel-9.10')
+    assert not policy.matches_product_version('epel-fedora-1')
@@ -1,8 +1,18 @@
 # SPDX-License-Identifier: GPL-2.0+
 
-from mock import patch
+import threading
+import time
+
+import pytest
+from mock import call, patch
 from json import loads
-from greenwave.request_session import get_requests_session
+from urllib3.exceptions import MaxRetryError
+
+from greenwave import request_session
+from greenwave.app_factory import create_app
+from greenwave.request_session import DeadlineRetry, get_requests_session, start_deadline
+from greenwave.resources import LatencyTracker, _hedged_request
+from requests import Response
 from requests.exceptions import ConnectionError
 
 
@@ -14,3 +24,144 @@ def test_retry_handler(mocked_request):
     resp = session.get('http://localhost.localdomain')
     assert resp.status_code == 502
     assert loads(resp.content) == {'message': msg_text}
+
+
+def test_pool_options():
+    session = get_requests_session('resultsdb', pool_maxsize=2, pool_block=True)
+    adapter = session.get_adapter('https://resultsdb.example.com')
+    pool = adapter.poolmanager.connection_from_url('https://resultsdb.example.com')
+    assert pool.pool.maxsize == 2
+    assert pool.block
+    assert pool.upstream == 'resultsdb'
+
+
+@patch('greenwave.request_session.http_pool_overflow_counter')
+@patch('greenwave.request_session.http_pool_connections_in_use_gauge')
+def test_pool_metrics(in_use_gauge, overflow_counter):
+    # pylint: disable=protected-access
+    session = get_requests_session('waiverdb', pool_maxsize=1)
+    adapter = session.get_adapter('http://waiverdb.example.com')
+    pool = adapter.poolmanager.connection_from_url('http://waiverdb.example.com')
+
+    conn1 = pool._get_conn()
+    conn2 = pool._get_conn()
+    pool._put_conn(conn2)
+    pool._put_conn(conn1)
+
+    in_use_gauge.labels.assert_called_with(upstream='waiverdb')
+    assert in_use_gauge.labels().set.mock_calls == [
+        call(1), call(2), call(1), call(0)]
+    overflow_counter.labels.assert_called_once_with(upstream='waiverdb')
+    overflow_counter.labels().inc.assert_called_once()
+
+
+@patch('greenwave.request_session.http_pool_overflow_counter')
+@patch('greenwave.request_session.http_pool_connections_in_use_gauge')
+def test_pool_metrics_for_multiple_hosts(in_use_gauge, overflow_counter):
+    # pylint: disable=protected-access
+    session = get_requests_session('waiverdb', pool_maxsize=1)
+    adapter = session.get_adapter('http://waiverdb.example.com')
+    pool1 = adapter.poolmanager.connection_from_url('http://waiverdb1.example.com')
+    pool2 = adapter.poolmanager.connection_from_url('http://waiverdb2.example.com')
+
+    conn1 = pool1._get_conn()
+    conn2 = pool2._get_conn()
+    pool1._put_conn(conn1)
+    pool2._put_conn(conn2)
+
+    assert in_use_gauge.labels().set.mock_calls == [
+        call(1), call(2), call(1), call(0)]
+    overflow_counter.labels().inc.assert_not_called()
+
+
+@patch('requests.adapters.HTTPAdapter.send')
+def test_deadline_shrinks_timeout(mocked_send):
+    mocked_send.return_value = Response()
+    mocked_send.return_value.status_code = 200
+    app = create_app('greenwave.config.TestingConfig')
+    session = get_requests_session()
+    with app.app_context():
+        start_deadline(2)
+        session.get('http://localhost.localdomain')
+        timeout = mocked_send.call_args[1]['timeout']
+        assert len(timeout) == 2
+        assert all(1 < t <= 2 for t in timeout)
+
+
+@patch('requests.adapters.HTTPAdapter.send')
+def test_deadline_exceeded(mocked_send):
+    app = create_app('greenwave.config.TestingConfig')
+    session = get_requests_session()
+    with app.app_context():
+        start_deadline(0)
+        resp = session.get('http://localhost.localdomain')
+    assert resp.status_code == 504
+    assert loads(resp.content) == {'message': 'Deadline for upstream requests exceeded'}
+    mocked_send.assert_not_called()
+
+
+def test_deadline_skips_retries():
+    retry = DeadlineRetry(total=3, backoff_factor=1)
+    request_session._request_deadline.deadline = time.monotonic() + 0.5
+    try:
+        # No delay before the first retry.
+        retry = retry.increment('GET', '/', error=ConnectionError('error 1'))
+        with pytest.raises(MaxRetryError):
+            retry.increment('GET', '/', error=ConnectionError('error 2'))
+    finally:
+        request_session._request_deadline.deadline = None
+
+
+def test_hedged_request():
+    app = create_app('greenwave.config.TestingConfig')
+    first_request = threading.Event()
+    finished = threading.Event()
+    responses = []
+
+    def request():
+        if not first_request.is_set():
+            first_request.set()
+            # The first request is slow.
+            finished.wait(timeout=5)
+            return 'slow'
+        return 'fast'
+
+    with app.app_context():
+        responses.append(_hedged_request(request, hedge_after=0.01))
+    finished.set()
+    assert responses == ['fast']
+
+
+@patch('greenwave.circuit_breaker._circuit_breakers', {})
+@patch('requests.adapters.HTTPAdapter.send')
+def test_circuit_breaker_fails_fast(mocked_send):
+    mocked_send.side_effect = ConnectionError('Connection refused')
+    app = create_app('greenwave.config.TestingConfig')
+    app.config['CIRCUIT_BREAKER_ENABLED'] = True
+    app.config['CIRCUIT_BREAKER'] = {'min_requests': 2, 'reset_timeout': 60}
+    session = get_requests_session('resultsdb')
+    with app.app_context():
+        for _ in range(2):
+            assert session.get('http://localhost.localdomain').status_code == 502
+        assert mocked_send.call_count == 2
+
+        resp = session.get('http://localhost.localdomain')
+    assert resp.status_code == 503
+    assert loads(resp.content) == {'message': 'Circuit breaker for resultsdb is open'}
+    assert mocked_send.call_count == 2
+
+
+@pytest.mark.parametrize('percent, expected', (
+    (0, 1),
+    (50, 100),
+    (90, 180),
+    (99.5, 199),
+    (100, 200),
+))
+def test_latency_tracker_percentile(percent, expected):
+    tracker = LatencyTracker(size=200)
+    assert tracker.percentile(percent, min_samples=1) is None
+    for latency in range(200, 0, -1):
+        tracker.add(latency)
+    assert tracker.percentile(percent, min_samples=1) == expected
+    assert tracker.percentile(percent, min_samples=201) is None
@@ -13,15 +13,14 @@ from greenwave.subjects.factory import create_subject
 
 
 @pytest.fixture(autouse=True)
-def mock_retrieve_decision():
-    with mock.patch('greenwave.decision.make_decision') as mocked:
-        def retrieve_decision(data, config):
-            #pylint: disable=unused-argument
-            if 'when' in data:
-                return None
-            return {}
-        mocked.side_effect = retrieve_decision
-        yield mocked
+def mock_retrieve_decision(mock_make_decision):
+    def retrieve_decision(data, config):
+        #pylint: disable=unused-argument
+        if 'when' in data:
+            return None
+        return {}
+    mock_make_decision.side_effect = retrieve_decision
+    yield mock_make_decision
 
 
 @pytest.fixture
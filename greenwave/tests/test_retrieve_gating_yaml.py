@@ -1,14 +1,19 @@
 # SPDX-License-Identifier: GPL-2.0+
 
 import socket
+import threading
+import xmlrpc.client
 from requests.exceptions import ConnectionError, HTTPError
 
 import pytest
 import mock
 from werkzeug.exceptions import BadGateway, NotFound
 
+from greenwave.app_factory import create_app
+from greenwave.config import TestingConfig
 from greenwave.resources import (
     NoSourceException,
+    prefetch_koji_builds,
     retrieve_scm_from_koji,
     retrieve_yaml_remote_rule,
 )
@@ -120,7 +125,8 @@ def test_retrieve_scm_from_build_with_missing_rev(app, koji_proxy):
 
 
 def test_retrieve_yaml_remote_rule_no_namespace(app):
-    with mock.patch('greenwave.resources.requests_session') as session:
+    with mock.patch('greenwave.resources.upstream_session') as upstream_session:
+        session = upstream_session.return_value
         # Return 404, because we are only interested in the URL in the request
         # and whether it is correct even with empty namespace.
         response = mock.MagicMock()
@@ -133,18 +139,14 @@ def test_retrieve_yaml_remote_rule_no_namespace(app):
         )
 
         assert session.request.mock_calls == [mock.call(
-            'HEAD', 'https://src.fedoraproject.org/pkg/raw/deadbeaf/f/gating.yaml'
+            'GET', 'https://src.fedoraproject.org/pkg/raw/deadbeaf/f/gating.yaml'
         )]
         assert returned_file is None
 
 
 def test_retrieve_yaml_remote_rule_connection_error(app):
     with mock.patch('requests.Session.request') as mocked_request:
-        response = mock.MagicMock()
-        response.status_code = 200
-        mocked_request.side_effect = [
-            response, ConnectionError('Something went terribly wrong...')
-        ]
+        mocked_request.side_effect = ConnectionError('Something went terribly wrong...')
 
         with pytest.raises(HTTPError) as excinfo:
             retrieve_yaml_remote_rule(
@@ -165,3 +167,171 @@ def test_retrieve_scm_from_koji_build_socket_error(app, koji_proxy):
     expected_error = 'Could not reach Koji: Socket is closed'
     with pytest.raises(socket.error, match=expected_error):
         retrieve_scm_from_koji(nvr)
+
+
+def test_koji_server_proxy_reused(app):
+    proxy = mock.Mock()
+    proxy.getBuild.return_value = {
+        'source': 'git+https://src.fedoraproject.org/rpms/nethack.git#deadbeef'
+    }
+    with mock.patch('greenwave.resources.get_server_proxy', return_value=proxy) as get_proxy, \
+            mock.patch('greenwave.resources._koji_data', threading.local()):
+        retrieve_scm_from_koji('nethack-3.6.1-3.fc29')
+        retrieve_scm_from_koji('nethack-3.6.1-4.fc29')
+
+        get_proxy.assert_called_once_with(app.config['KOJI_BASE_URL'], 15, None)
+        assert proxy.getBuild.call_count == 2
+
+        # Separate proxy object is used in other threads.
+        def retrieve_in_thread():
+            with app.app_context():
+                retrieve_scm_from_koji('nethack-3.6.1-5.fc29')
+
+        thread = threading.Thread(target=retrieve_in_thread)
+        thread.start()
+        thread.join()
+        assert get_proxy.call_count == 2
+
+
+def test_prefetch_koji_builds(app, koji_proxy):
+    koji_proxy.multiCall.return_value = [
+        [{'source': 'git+https://src.fedoraproject.org/rpms/nethack.git#deadbeef'}],
+        [{'source': 'git+https://src.fedoraproject.org/rpms/nethack.git#beefdead'}],
+        {'faultCode': 1000, 'faultString': 'No such build'},
+    ]
+    nvrs = ['nethack-3.6.1-3.fc29', 'nethack-3.6.1-4.fc29', 'nethack-3.6.1-5.fc29']
+    prefetch_koji_builds(nvrs, app.config['KOJI_BASE_URL'])
+    koji_proxy.multiCall.assert_called_once_with([
+        {'methodName': 'getBuild', 'params': [nvr]}
+        for nvr in nvrs
+    ])
+
+    assert retrieve_scm_from_koji(nvrs[0]) == ('rpms', 'nethack', 'deadbeef')
+    assert retrieve_scm_from_koji(nvrs[1]) == ('rpms', 'nethack', 'beefdead')
+    with pytest.raises(xmlrpc.client.Fault, match='No such build'):
+        retrieve_scm_from_koji(nvrs[2])
+    koji_proxy.getBuild.assert_not_called()
+
+    # Builds are not retrieved again.
+    prefetch_koji_builds(nvrs, app.config['KOJI_BASE_URL'])
+    koji_proxy.multiCall.assert_called_once()
+
+
+def test_prefetch_koji_builds_error(app, koji_proxy):
+    koji_proxy.multiCall.side_effect = socket.error('Socket is closed')
+    koji_proxy.getBuild.return_value = {
+        'source': 'git+https://src.fedoraproject.org/rpms/nethack.git#deadbeef'
+    }
+    nvrs = ['nethack-3.6.1-3.fc29', 'nethack-3.6.1-4.fc29']
+    prefetch_koji_builds(nvrs, app.config['KOJI_BASE_URL'])
+    assert retrieve_scm_from_koji(nvrs[0]) == ('rpms', 'nethack', 'deadbeef')
+    koji_proxy.getBuild.assert_called_once_with(nvrs[0])
+
+
+@pytest.fixture
+def cached_app():
+    config = TestingConfig()
+    config.CACHE = {'backend': 'dogpile.cache.memory', 'expiration_time': 60}
+    config.NEGATIVE_CACHE = {'backend': 'dogpile.cache.memory', 'expiration_time': 10}
+    app = create_app(config)
+    with app.app_context():
+        yield app
+
+
+def _remote_rule_response(status_code, content=None, headers=None):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.content = content
+    response.headers = headers or {}
+    return response
+
+
+def test_retrieve_yaml_remote_rule_revalidate(cached_app):
+    url = 'https://src.fedoraproject.org/rpms/pkg/raw/master/f/gating.yaml'
+    with mock.patch('greenwave.resources.upstream_session') as upstream_session, \
+            mock.patch('time.time', return_value=1000):
+        session = upstream_session.return_value
+        session.request.return_value = _remote_rule_response(
+            200, b'--- !Policy', {'ETag': '"abc"', 'Last-Modified': 'Wed, 21 Oct 2015'})
+        assert retrieve_yaml_remote_rule(url) == b'--- !Policy'
+        assert retrieve_yaml_remote_rule(url) == b'--- !Policy'
+        session.request.assert_called_once_with('GET', url)
+
+    with mock.patch('greenwave.resources.upstream_session') as upstream_session, \
+            mock.patch('time.time', return_value=1100):
+        session = upstream_session.return_value
+        session.request.return_value = _remote_rule_response(304)
+        assert retrieve_yaml_remote_rule(url) == b'--- !Policy'
+        session.request.assert_called_once_with('GET', url, headers={
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Wed, 21 Oct 2015',
+        })
+
+    with mock.patch('greenwave.resources.upstream_session') as upstream_session, \
+            mock.patch('time.time', return_value=1200):
+        session = upstream_session.return_value
+        session.request.return_value = _remote_rule_response(200, b'--- !Policy\n')
+        assert retrieve_yaml_remote_rule(url) == b'--- !Policy\n'
+
+
+def test_retrieve_yaml_remote_rule_pinned_to_commit(cached_app):
+    url = (
+        'https://src.fedoraproject.org/rpms/pkg/raw/'
+        'c3c47a08a66451cb9686c49f040776ed35a0d1bb/f/gating.yaml'
+    )
+    with mock.patch('greenwave.resources.upstream_session') as upstream_session:
+        session = upstream_session.return_value
+        session.request.return_value = _remote_rule_response(200, b'--- !Policy')
+        with mock.patch('time.time', return_value=1000):
+            assert retrieve_yaml_remote_rule(url) == b'--- !Policy'
+        with mock.patch('time.time', return_value=100000):
+            assert retrieve_yaml_remote_rule(url) == b'--- !Policy'
+        session.request.assert_called_once_with('GET', url)
+
+
+def test_retrieve_yaml_remote_rule_not_found_cached(cached_app):
+    url = 'https://src.fedoraproject.org/rpms/pkg/raw/master/f/gating.yaml'
+    with mock.patch('greenwave.resources.upstream_session') as upstream_session:
+        session = upstream_session.return_value
+        session.request.return_value = _remote_rule_response(404)
+        with mock.patch('time.time', return_value=1000):
+            assert retrieve_yaml_remote_rule(url) is None
+            assert retrieve_yaml_remote_rule(url) is None
+        session.request.assert_called_once_with('GET', url)
+
+        session.request.return_value = _remote_rule_response(200, b'--- !Policy')
+        with mock.patch('time.time', return_value=1020):
+            assert retrieve_yaml_remote_rule(url) == b'--- !Policy'
+        assert session.request.call_count == 2
+
+
+def test_retrieve_scm_from_nonexistent_build_cached(cached_app, koji_proxy):
+    nvr = 'foo-1.2.3-1.fc29'
+    koji_proxy.getBuild.return_value = {}
+    for _ in range(2):
+        with cached_app.app_context(), pytest.raises(NotFound):
+            retrieve_scm_from_koji(nvr)
+    koji_proxy.getBuild.assert_called_once_with(nvr)
+
+
+def test_retrieve_scm_from_build_with_missing_source_cached(cached_app, koji_proxy):
+    nvr = 'foo-1.2.3-1.fc29'
+    koji_proxy.getBuild.return_value = {'nvr': nvr}
+    for _ in range(2):
+        with cached_app.app_context(), pytest.raises(NoSourceException):
+            retrieve_scm_from_koji(nvr)
+    koji_proxy.getBuild.assert_called_once_with(nvr)
+
+
+def test_retrieve_yaml_remote_rule_ignores_old_cache_format(cached_app):
+    url = (
+        'https://src.fedoraproject.org/rpms/pkg/raw/'
+        'c3c47a08a66451cb9686c49f040776ed35a0d1bb/f/gating.yaml'
+    )
+    # Content cached by older releases
+    cached_app.cache.set(f'greenwave.resources:retrieve_yaml_remote_rule|{url}', b'--- old')
+    with mock.patch('greenwave.resources.upstream_session') as upstream_session:
+        session = upstream_session.return_value
+        session.request.return_value = _remote_rule_response(200, b'--- !Policy')
+        assert retrieve_yaml_remote_rule(url) == b'--- !Policy'
+        session.request.assert_called_once_with('GET', url)
@@ -7,7 +7,7 @@ from werkzeug.exceptions import NotFound
 
 from greenwave.app_factory import create_app
 from greenwave.decision import Decision
-from greenwave.policies import Policy, RemoteRule
+from greenwave.policies import Policy, RemotePolicy, RemoteRule
 from greenwave.resources import NoSourceException
 from greenwave.safe_yaml import SafeYAMLError
 from greenwave.subjects.factory import create_subject
@@ -338,3 +338,87 @@ def test_passing_test_case_rule_replace_using_valid_times(
         decision.check(subject, policies, results_retriever=results_retriever)
         assert [x.to_json()['type'] for x in decision.answers] == ['test-result-missing']
         assert decision.answers[0].test_case_name == test_case_name
+
+
+def test_passing_test_case_rule_valid_times_multiple_subjects(koji_proxy):
+    policy_yaml = dedent("""
+        --- !Policy
+        id: "some_policy"
+        product_versions: [rhel-9000]
+        decision_context: bodhi_update_push_stable
+        subject_type: koji_build
+        rules:
+          - !PassingTestCaseRule {test_case_name: some_test_case, valid_since: 2021-10-06}
+    """)
+
+    app = create_app('greenwave.config.TestingConfig')
+    with app.app_context():
+        subjects = [
+            create_subject('koji_build', 'nethack-1.2.3-1.el9000'),
+            create_subject('koji_build', 'nethack-1.2.4-1.el9000'),
+        ]
+        policies = Policy.safe_load_all(policy_yaml)
+
+        koji_proxy.multiCall.return_value = [
+            [{'creation_time': '2021-10-05 06:00:00.000000+00:00'}],
+            [{'creation_time': '2021-10-06 06:00:00.000000+00:00'}],
+        ]
+        decision = Decision('bodhi_update_push_stable', 'rhel-9000')
+
+        results_retriever = mock.MagicMock()
+        results_retriever.retrieve.return_value = []
+        decision.check_subjects(subjects, policies, results_retriever=results_retriever)
+        assert [x.to_json()['type'] for x in decision.answers] == ['test-result-missing']
+        assert decision.answers[0].subject.identifier == 'nethack-1.2.4-1.el9000'
+        koji_proxy.multiCall.assert_called_once()
+        koji_proxy.getBuild.assert_not_called()
+
+
+@mock.patch('greenwave.resources.retrieve_yaml_remote_rule')
+@mock.patch('greenwave.resources.retrieve_scm_from_koji')
+def test_remote_rule_parsed_policies_cached(
+        mock_retrieve_scm_from_koji, mock_retrieve_yaml_remote_rule):
+    policy_yaml = dedent("""
+        --- !Policy
+        id: "some_policy"
+        product_versions: [rhel-9000]
+        decision_context: bodhi_update_push_stable
+        subject_type: koji_build
+        rules:
+          - !RemoteRule {}
+    """)
+    mock_retrieve_yaml_remote_rule.return_value = dedent("""
+        --- !Policy
+        product_versions: [rhel-*]
+        decision_context: bodhi_update_push_stable
+        rules:
+          - !PassingTestCaseRule {test_case_name: some_test_case}
+    """)
+    nvr = 'nethack-1.2.3-1.el9000'
+    mock_retrieve_scm_from_koji.return_value = ('rpms', nvr, '123')
+
+    app = create_app('greenwave.config.TestingConfig')
+    with app.app_context():
+        subject = create_subject('koji_build', nvr)
+        policies = Policy.safe_load_all(policy_yaml)
+        results_retriever = mock.MagicMock()
+        results_retriever.retrieve.return_value = []
+
+        with mock.patch(
+                'greenwave.policies.RemotePolicy.safe_load_all',
+                wraps=RemotePolicy.safe_load_all) as safe_load_all:
+            for _ in range(2):
+                decision = Decision('bodhi_update_push_stable', 'rhel-9000')
+                decision.check(subject, policies, results_retriever=results_retriever)
+                assert [x.to_json()['type'] for x in decision.answers] == [
+                    'fetched-gating-yaml', 'test-result-missing']
+
+        safe_load_all.assert_called_once()
+        assert app.remote_policies_cache.hits == 3
+        assert app.remote_policies_cache.misses == 1
+
+        # Changed content is parsed again.
+        mock_retrieve_yaml_remote_rule.return_value += '\n# comment'
+        decision = Decision('bodhi_update_push_stable', 'rhel-9000')
+        decision.check(subject, policies, results_retriever=results_retriever)
+        assert app.remote_policies_cache.misses == 2
@@ -1,4 +1,6 @@
 # SPDX-License-Identifier: GPL-2.0+
+import pytest
+
 from greenwave.policies import (
     InvalidRemoteRuleYaml,
     TestResultErrored,
@@ -279,3 +281,64 @@ def test_waive_scenarios_all():
         ),
     ]
     assert expected_json == [w.to_json() for w in waived]
+
+
+def many_answers_and_waivers():
+    subject_type = GenericSubjectType('compose')
+    answers = [
+        TestResultFailed(
+            subject=Subject(subject_type, f'compose-{i % 20}'),
+            test_case_name=f'test{i % 50}',
+            source=None,
+            result_id=i,
+            data={'scenario': f'scenario{i % 3}'},
+        )
+        for i in range(3000)
+    ]
+    waivers = [
+        dict(
+            subject_type='compose',
+            subject_identifier=f'compose-{i % 20}',
+            testcase=f'test{i % 40}',
+            scenario=f'scenario{i % 2}' if i % 5 else None,
+        )
+        for i in range(500)
+    ]
+    return answers, waivers
+
+
+def linear_waive_answers(answers, waivers):
+    """Waives answers by checking each waiver for each answer."""
+    return [
+        answer.to_waived() if any(
+            waiver['subject_type'] == answer.subject.type and
+            waiver['subject_identifier'] == answer.subject.identifier and
+            waiver['testcase'] == answer.test_case_name and
+            (not waiver.get('scenario') or waiver['scenario'] == answer.scenario)
+            for waiver in waivers
+        ) else answer
+        for answer in answers
+    ]
+
+
+def test_waive_many_answers():
+    answers, waivers = many_answers_and_waivers()
+    expected = linear_waive_answers(answers, waivers)
+    waived = waive_answers(answers, waivers)
+    assert [answer.to_json() for answer in waived] == [
+        answer.to_json() for answer in expected]
+    assert any(answer.to_json()['type'].endswith('-waived') for answer in waived)
+
+
+@pytest.mark.benchmark
+def test_benchmark_waive_answers(compare_timings):
+    """
+    Compares waiving many answers with the waiver index and with checking
+    each waiver for each answer.
+    """
+    answers, waivers = many_answers_and_waivers()
+    linear_time, index_time = compare_timings(
+        lambda: linear_waive_answers(answers, waivers),
+        lambda: waive_answers(answers, waivers),
+    )
+    assert index_time < linear_time
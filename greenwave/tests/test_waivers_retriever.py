@@ -2,6 +2,7 @@
 
 import mock
 
+from greenwave.app_factory import create_app
 from greenwave.resources import WaiversRetriever
 
 _DUMMY_RETRIEVER_ARGUMENTS = dict(
@@ -61,3 +62,68 @@ def test_waivers_retriever_ignores_no_waived():
     retriever._retrieve_data = mock.MagicMock(return_value=[waiver])
     waivers = retriever.retrieve(_DUMMY_FILTERS)
     assert [] == waivers
+
+
+def test_waivers_retriever_splits_filters():
+    # pylint: disable=protected-access
+    retriever = WaiversRetriever(
+        max_filters_per_request=2, **_DUMMY_RETRIEVER_ARGUMENTS)
+    waiver1 = dict(id=1, waived=True)
+    waiver2 = dict(id=2, waived=True)
+    waiver3 = dict(id=3, waived=True)
+    retriever._retrieve_data = mock.MagicMock(
+        side_effect=[[waiver1, waiver2], [waiver2], [waiver3, waiver1]])
+    waivers = retriever.retrieve(['f1', 'f2', 'f3', 'f4', 'f5'])
+    assert retriever._retrieve_data.mock_calls == [
+        mock.call(['f1', 'f2']),
+        mock.call(['f3', 'f4']),
+        mock.call(['f5']),
+    ]
+    assert waivers == [waiver1, waiver2, waiver3]
+
+
+def test_waivers_retriever_uses_prefetched_waivers():
+    # pylint: disable=protected-access
+    retriever = WaiversRetriever(**_DUMMY_RETRIEVER_ARGUMENTS)
+    waiver1 = dict(id=1, testcase='test1', waived=True)
+    waiver2 = dict(id=2, testcase='test2', waived=True)
+    retriever._retrieve_data = mock.MagicMock(return_value=[waiver1, waiver2])
+
+    app = create_app('greenwave.config.TestingConfig')
+    with app.app_context():
+        retriever.prefetch([{'testcase': 'test1'}, {'testcase': 'test2'}])
+        retriever.start_prefetch()
+        assert retriever.retrieve([{'testcase': 'test2'}]) == [waiver2]
+        retriever._retrieve_data.assert_called_once_with(
+            [{'testcase': 'test1'}, {'testcase': 'test2'}])
+
+        # Fall back to requesting waivers for filters not prefetched.
+        retriever._retrieve_data.return_value = [waiver1]
+        waivers = retriever.retrieve([{'testcase': 'test1'}, {'testcase': 'test3'}])
+        assert waivers == [waiver1]
+        assert retriever._retrieve_data.mock_calls[-1] == mock.call(
+            [{'testcase': 'test1'}, {'testcase': 'test3'}])
+
+
+def test_waivers_retriever_reuses_latest_waivers_per_filter():
+    # pylint: disable=protected-access
+    filter1 = dict(subject_type='koji_build', subject_identifier='nvr', testcase='test1')
+    filter2 = dict(subject_type='koji_build', subject_identifier='nvr', testcase='test2')
+    waiver1 = dict(filter1, id=1, waived=True, timestamp='2021-01-01T00:00:00.000000')
+    waiver2 = dict(filter2, id=2, waived=True, timestamp='2021-01-01T00:00:00.000000')
+
+    latest = WaiversRetriever(**_DUMMY_RETRIEVER_ARGUMENTS)
+    latest._retrieve_data = mock.MagicMock(return_value=[waiver1, waiver2])
+    assert latest.retrieve([filter1, filter2]) == [waiver1, waiver2]
+
+    retriever = WaiversRetriever(
+        **dict(_DUMMY_RETRIEVER_ARGUMENTS, when='2022-01-01T00:00:00.000000'))
+    retriever.latest = latest
+    retriever._retrieve_data = mock.MagicMock(return_value=[])
+    assert retriever.retrieve([filter2]) == [waiver2]
+    retriever._retrieve_data.assert_not_called()
+
+    # Waivers for a filter not requested by the latest retriever are retrieved.
+    filter3 = dict(filter1, testcase='test3')
+    assert retriever.retrieve([filter1, filter3]) == []
+    retriever._retrieve_data.assert_called_once()
@@ -1,9 +1,13 @@
 # SPDX-License-Identifier: GPL-2.0+
 
+import xmlrpc.client
+
 import mock
 import pytest
 
 from greenwave import xmlrpc_server_proxy
+from greenwave.circuit_breaker import CLOSED, OPEN, CircuitBreaker
+from greenwave.request_session import start_deadline
 
 
 @pytest.mark.parametrize(
@@ -32,3 +36,41 @@ def test_get_server_proxy(
     elif expected_transport == xmlrpc_server_proxy.SafeTransport:
         mock_safe_transport.__init__.assert_called_once_with(url, expected_timeout)
         mock_transport.__init__.assert_not_called()
+
+
+def test_transport_circuit_breaker():
+    breaker = CircuitBreaker('koji', min_requests=1, reset_timeout=60)
+    proxy = xmlrpc_server_proxy.get_server_proxy('http://localhost:1/kojihub', 1, breaker)
+    with mock.patch('xmlrpc.client.Transport.request', side_effect=ConnectionRefusedError):
+        with pytest.raises(ConnectionRefusedError):
+            proxy.getBuild('nethack-3.6.1-3.fc29')
+        assert breaker.state == OPEN
+
+    with pytest.raises(ConnectionRefusedError, match='Circuit breaker for koji is open'):
+        proxy.getBuild('nethack-3.6.1-3.fc29')
+
+
+def test_transport_circuit_breaker_ignores_faults():
+    breaker = CircuitBreaker('koji', min_requests=1, reset_timeout=60)
+    proxy = xmlrpc_server_proxy.get_server_proxy('http://localhost:1/kojihub', 1, breaker)
+    fault = xmlrpc.client.Fault(1000, 'No such build')
+    with mock.patch('xmlrpc.client.Transport.request', side_effect=fault):
+        with pytest.raises(xmlrpc.client.Fault):
+            proxy.getBuild('nethack-3.6.1-3.fc29')
+    assert breaker.state == CLOSED
+
+
+def test_transport_deadline_shrinks_timeout(app):
+    start_deadline(2)
+    transport = xmlrpc_server_proxy.Transport(timeout=15)
+    connection = transport.make_connection('localhost:1')
+    assert 1 < connection.timeout <= 2
+
+
+def test_transport_deadline_exceeded(app):
+    start_deadline(0)
+    proxy = xmlrpc_server_proxy.get_server_proxy('http://localhost:1/kojihub', 15)
+    with mock.patch('xmlrpc.client.Transport.request') as request:
+        with pytest.raises(TimeoutError, match='Deadline for upstream requests exceeded'):
+            proxy.getBuild('nethack-3.6.1-3.fc29')
+    request.assert_not_called()
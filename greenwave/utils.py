@@ -14,14 +14,23 @@ from werkzeug.exceptions import HTTPException
 log = logging.getLogger(__name__)
 
 
-def json_error(error):
-    """
-    Return error responses in JSON.
+# Errors converted to JSON error responses.
+HANDLED_ERRORS = (
+    HTTPException,
+    ConnectionError,
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.HTTPError,
+)
 
-    :param error: One of Exceptions. It could be HTTPException, ConnectionError, or
-    Timeout.
-    :return: JSON error response.
 
+def error_message_and_status(error):
+    """
+    Returns error message and HTTP status code for an exception.
+
+    :param error: One of Exceptions. It could be HTTPException, ConnectionError,
+    Timeout or HTTPError.
+    :return: Pair with error message and status code.
     """
     if isinstance(error, HTTPException):
         msg = error.description
@@ -35,11 +44,30 @@ def json_error(error):
         current_app.logger.exception('Timeout error: %s', error)
         msg = 'Timeout connecting to upstream server: {}'.format(error)
         status_code = 504
+    elif isinstance(error, requests.HTTPError):
+        current_app.logger.exception('Upstream server error: %s', error)
+        msg = 'Error response from upstream server: {}'.format(error)
+        upstream_status_code = getattr(error.response, 'status_code', None)
+        status_code = 504 if upstream_status_code == 504 else 502
     else:
         current_app.logger.exception('Unexpected server error: %s', error)
         msg = 'Server encountered unexpected error'
         status_code = 500
 
+    return msg, status_code
+
+
+def json_error(error):
+    """
+    Return error responses in JSON.
+
+    :param error: One of Exceptions. It could be HTTPException, ConnectionError, or
+    Timeout.
+    :return: JSON error response.
+
+    """
+    msg, status_code = error_message_and_status(error)
+
     response = jsonify(message=msg)
     response.status_code = status_code
 
@@ -1,25 +1,37 @@
 # SPDX-License-Identifier: GPL-2.0+
 
+# Scenario key for waivers matching any scenario.
+ANY_SCENARIO = None
 
-def _is_waived(answer, waivers):
+
+def _index_waivers(waivers):
+    """
+    Returns dict mapping subject type, subject identifier and test case name
+    to set of waived scenarios (ANY_SCENARIO if waiver does not specify any).
+    """
+    index = {}
+    for waiver in waivers:
+        key = (waiver['subject_type'], waiver['subject_identifier'], waiver['testcase'])
+        index.setdefault(key, set()).add(waiver.get('scenario') or ANY_SCENARIO)
+    return index
+
+
+def _is_waived(answer, waiver_index):
     """
     Returns true only if there is a matching waiver for given answer.
     """
-    return any(
-        waiver['subject_type'] == answer.subject.type and
-        waiver['subject_identifier'] == answer.subject.identifier and
-        waiver['testcase'] == answer.test_case_name and
-        (not waiver.get('scenario') or waiver['scenario'] == answer.scenario)
-        for waiver in waivers
-    )
+    key = (answer.subject.type, answer.subject.identifier, answer.test_case_name)
+    scenarios = waiver_index.get(key)
+    return scenarios is not None and (
+        ANY_SCENARIO in scenarios or answer.scenario in scenarios)
 
 
-def _maybe_waive(answer, waivers):
+def _maybe_waive(answer, waiver_index):
     """
     Returns waived answer if it's unsatisfied there is a matching waiver,
     otherwise returns unchanged answer.
     """
-    if not answer.is_satisfied and _is_waived(answer, waivers):
+    if not answer.is_satisfied and _is_waived(answer, waiver_index):
         return answer.to_waived()
     return answer
 
@@ -29,6 +41,25 @@ def waive_answers(answers, waivers):
     Returns answers with unsatisfied answers waived
     (`RuleNotSatisfied.to_waived()`) if there is a matching waiver.
     """
-    waived_answers = [_maybe_waive(answer, waivers) for answer in answers]
+    waiver_index = _index_waivers(waivers)
+    waived_answers = [_maybe_waive(answer, waiver_index) for answer in answers]
     waived_answers = [answer for answer in waived_answers if answer is not None]
     return waived_answers
+
+
+def _matches_filter(waiver, waiver_filter):
+    return all(
+        waiver.get(key) == value
+        for key, value in waiver_filter.items()
+        if key != 'since'
+    )
+
+
+def filter_waivers(waivers, filters):
+    """
+    Returns waivers matching any of the WaiverDB filters.
+    """
+    return [
+        waiver for waiver in waivers
+        if any(_matches_filter(waiver, waiver_filter) for waiver_filter in filters)
+    ]
@@ -2,12 +2,18 @@
 # SPDX-License-Identifier: GPL-2.0+
 """
 Provides an "xmlrpc.client.ServerProxy" object with a timeout on the socket.
+
+The timeout is shortened to finish before the deadline for upstream requests
+(see greenwave.request_session.start_deadline()).
 """
+import time
 import urllib.parse
 import xmlrpc.client
 
+from greenwave.request_session import get_deadline
+
 
-def get_server_proxy(uri, timeout):
+def get_server_proxy(uri, timeout, circuit_breaker=None):
     """
     Create an :py:class:`xmlrpc.client.ServerProxy` instance with a socket timeout.
 
@@ -16,6 +22,8 @@ def get_server_proxy(uri, timeout):
     Args:
         uri (str): The connection point on the server in the format of scheme://host/target.
         timeout (int): The timeout to set on the transport socket.
+        circuit_breaker (greenwave.circuit_breaker.CircuitBreaker): Optional
+            circuit breaker for the server.
 
     Returns:
         xmlrpc.client.ServerProxy: An instance of :py:class:`xmlrpc.client.ServerProxy` with
@@ -23,30 +31,61 @@ def get_server_proxy(uri, timeout):
     """
     parsed_uri = urllib.parse.urlparse(uri)
     if parsed_uri.scheme == 'https':
-        transport = SafeTransport(timeout=timeout)
+        transport = SafeTransport(timeout=timeout, circuit_breaker=circuit_breaker)
     else:
-        transport = Transport(timeout=timeout)
+        transport = Transport(timeout=timeout, circuit_breaker=circuit_breaker)
 
     return xmlrpc.client.ServerProxy(uri, transport=transport, allow_none=True)
 
 
-class Transport(xmlrpc.client.Transport):
-    def __init__(self, *args, timeout=None, **kwargs):  # pragma: no cover
+class TransportMixin:
+    def __init__(self, *args, timeout=None, circuit_breaker=None, **kwargs):  # pragma: no cover
         super().__init__(*args, **kwargs)
         self._timeout = timeout
+        self._circuit_breaker = circuit_breaker
 
-    def make_connection(self, host):  # pragma: no cover
+    def make_connection(self, host):
         connection = super().make_connection(host)
-        connection.timeout = self._timeout
+        timeout = self._timeout
+        deadline = get_deadline()
+        if deadline is not None:
+            remaining = max(0, deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        connection.timeout = timeout
+        # The connection can be kept open from a previous request.
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
         return connection
 
+    def request(self, *args, **kwargs):
+        deadline = get_deadline()
+        if deadline is not None and deadline <= time.monotonic():
+            raise TimeoutError('Deadline for upstream requests exceeded')
 
-class SafeTransport(xmlrpc.client.SafeTransport):
-    def __init__(self, *args, timeout=None, **kwargs):  # pragma: no cover
-        super().__init__(*args, **kwargs)
-        self._timeout = timeout
+        breaker = self._circuit_breaker
+        if breaker is None:
+            return super().request(*args, **kwargs)
 
-    def make_connection(self, host):  # pragma: no cover
-        connection = super().make_connection(host)
-        connection.timeout = self._timeout
-        return connection
+        token = breaker.allow_request()
+        if token is None:
+            raise ConnectionRefusedError(f'Circuit breaker for {breaker.upstream} is open')
+
+        failed = True
+        try:
+            result = super().request(*args, **kwargs)
+            failed = False
+            return result
+        except xmlrpc.client.Fault:
+            # Server is healthy, the call itself failed.
+            failed = False
+            raise
+        finally:
+            breaker.record(token, failed=failed)
+
+
+class Transport(TransportMixin, xmlrpc.client.Transport):
+    pass
+
+
+class SafeTransport(TransportMixin, xmlrpc.client.SafeTransport):
+    pass